@@ -6,65 +6,113 @@ Image.ANTIALIAS = Image.Resampling.LANCZOS
 import numpy as np
 import ddddocr
 import io
-import json
 import re
-from collections import defaultdict
+from subtitle_band import binarize_band
+from subtitle_extractor import SubtitleExtractorBase
+
+
+def _ctc_decode(result):
+    """将逐步的字符概率解码为文本，置信度为输出字符概率的平均值"""
+    charsets = result['charsets']
+    probability = np.array(result['probability'], dtype=np.float32)
+    if probability.size == 0:
+        return '', 0.0
+    if probability.ndim == 1:
+        probability = probability[None, :]
+    best = probability.argmax(axis=1)
+    chars = []
+    scores = []
+    last = 0
+    for step, index in enumerate(best):
+        if index != last and index != 0:
+            chars.append(charsets[index])
+            scores.append(probability[step, index])
+        last = index
+    return ''.join(chars), float(np.mean(scores)) if scores else 0.0
+
+
+def recognize_mask(ocr, mask):
+    """用ddddocr识别二值化后的字幕区域，返回 (文本, 置信度)，ddddocr版本不支持输出概率时置信度为None"""
+    img_array = np.zeros(mask.shape + (3,), dtype=np.uint8)
+    img_array[mask] = [255, 255, 255]
+
+    # 转换为PIL图像
+    processed_img = Image.fromarray(img_array)
+
+    # 准备OCR
+    buffer = io.BytesIO()
+    processed_img.convert('RGB').save(buffer, format='PNG')
+    image_bytes = buffer.getvalue()
+
+    # OCR识别
+    try:
+        text, confidence = _ctc_decode(ocr.classification(image_bytes, probability=True))
+    except TypeError:
+        text, confidence = ocr.classification(image_bytes), None
+    text = text.strip() if text else None
+    return text, confidence
+
+
+class SubtitleExtractor(SubtitleExtractorBase):
+    cache_engine = "ddddocr"
 
-class SubtitleExtractor:
     def __init__(self):
         # 只初始化 OCR
         self.ocr = ddddocr.DdddOcr()
-        
-        # 设置字幕区域裁剪范围
-        self.crop_box = (235, 900, 235 + 1200, 900 + 90)
+        super().__init__()
         
         # 正则表达式模式
         self.pattern = r'\[([^]]+)\]([^_]+)_(\d+m\d+s)_sim_(\d+\.\d+)'
+
+    def process_band(self, img_array):
+        """对已裁剪的字幕区域进行二值化和文字识别"""
+        return self.process_band_scored(img_array)[0]
+
+    def process_band_scored(self, img_array):
+        """对已裁剪的字幕区域进行二值化和文字识别，返回 (文本, 置信度)，复用已有结果时置信度为None"""
+        img_array = np.array(img_array)
         
-        # 存储字幕的字典
-        self.subtitles_dict = defaultdict(list)
+        # 图像预处理
+        mask = binarize_band(img_array)
+
+        # 字幕区域与上一帧相同时直接复用识别结果
+        hit, text = self.change_detector.lookup(mask)
+        if hit:
+            return text, None
+
+        # 之前识别过相同的字幕时直接使用缓存结果
+        key = self.cache.key(mask)
+        cached, text = self.cache.get(key)
+        confidence = None
+        if not cached:
+            text, confidence = recognize_mask(self.ocr, mask)
+            self.cache.put(key, text)
+        self.change_detector.update(mask, text, cached)
+        return text, confidence
+
+    def process_bands(self, bands):
+        """逐个识别多个字幕区域（ddddocr不支持批量推理）"""
+        return [self.process_band(band) for band in bands]
 
-    def parse_timestamp(self, timestamp):
-        """将时间戳 (如 "2m28s") 转换为总秒数"""
-        match = re.match(r'(\d+)m(\d+)s', timestamp)
-        if match:
-            minutes, seconds = map(int, match.groups())
-            return minutes * 60 + seconds
-        return 0
+    def process_bands_scored(self, bands):
+        """逐个识别多个字幕区域，返回 (文本, 置信度) 列表"""
+        return [self.process_band_scored(band) for band in bands]
 
     def process_image(self, img_path):
         """处理单个图像并提取文字"""
         img = Image.open(img_path)
-        
-        if img.size != (1920, 1080):
-            return None
             
         # 裁剪图像
-        cropped_img = img.crop(self.crop_box)
-        
-        # 图像预处理
-        img_array = np.array(cropped_img)
-        mask = np.all(img_array > 245, axis=2)
-        img_array[mask] = [255, 255, 255]
-        img_array[~mask] = [0, 0, 0]
-        
-        # 转换为PIL图像
-        processed_img = Image.fromarray(img_array)
-        
-        # 准备OCR
-        buffer = io.BytesIO()
-        processed_img.convert('RGB').save(buffer, format='PNG')
-        image_bytes = buffer.getvalue()
-        
-        # OCR识别
-        text = self.ocr.classification(image_bytes)
-        return text.strip() if text else None
+        cropped_img = img.convert('RGB').crop(self.roi.area_for(img.height, img.width))
+        return self.process_band(np.array(cropped_img))
 
     def process_frames(self, input_folder, output_folder):
         """处理文件夹中的所有帧并生成字幕"""
         if not os.path.exists(output_folder):
             os.makedirs(output_folder)
 
+        self.writer.folder = output_folder
+        current_title = None
         for filename in sorted(os.listdir(input_folder)):
             if not filename.endswith(('.jpg', '.png')):
                 continue
@@ -76,37 +124,18 @@ class SubtitleExtractor:
             episode_num, title, timestamp, similarity = match.groups()
             video_title = f"{episode_num}{title}"
             print(f"处理文件: {filename}")
+
+            # 帧按文件名排序，同一视频的帧连续出现，切换到下一个视频时保存上一个
+            if current_title is not None and video_title != current_title:
+                self.save_subtitles(output_folder, current_title)
+            current_title = video_title
             
             img_path = os.path.join(input_folder, filename)
             text = self.process_image(img_path)
-            
-            if not text:
-                continue
-
-            print(f"识别到文本: {text}")
-            
-            # 检查重复
-            subtitles = self.subtitles_dict[video_title]
-            if subtitles and subtitles[-1]["text"] == text:
-                continue
-            
-            # 添加字幕
-            self.subtitles_dict[video_title].append({
-                "timestamp": timestamp,
-                "similarity": float(similarity),
-                "text": text
-            })
+            self.add_subtitle(video_title, timestamp, similarity, text)
 
         # 保存字幕文件
-        for video_title, subtitles in self.subtitles_dict.items():
-            sorted_subtitles = sorted(subtitles, key=lambda x: self.parse_timestamp(x["timestamp"]))
-            output_json = os.path.join(output_folder, f"{video_title}.json")
-            
-            try:
-                with open(output_json, 'w', encoding='utf-8') as f:
-                    json.dump(sorted_subtitles, f, ensure_ascii=False, indent=4)
-                print(f"成功保存 {video_title} 的字幕")
-            except Exception as e:
-                print(f"保存文件时出错: {str(e)}")
-
-        print("\n处理完成")
\ No newline at end of file
+        self.save_subtitles(output_folder)
+        self.report()
+
+        print("\n处理完成")
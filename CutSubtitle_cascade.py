@@ -0,0 +1,109 @@
+from difflib import SequenceMatcher
+import traceback
+import ddddocr
+from CutSubtitle import recognize_mask
+from CutSubtitle_paddleocr import SubtitleExtractor as PaddleSubtitleExtractor, _PendingText
+from params import CASCADE_MIN_CONFIDENCE, CASCADE_NEIGHBOR_SIMILARITY
+from subtitle_band import binarize_band
+
+
+class SubtitleExtractor(PaddleSubtitleExtractor):
+    """两级OCR：每个字幕区域先用ddddocr识别，结果可疑时再交给PaddleOCR
+
+    以下情况视为可疑：ddddocr没有识别出文字、置信度低于CASCADE_MIN_CONFIDENCE、
+    或与相邻字幕区域的识别结果相近但不相同（同一句字幕被识别出了不同的字）。
+    其余接口与PaddleOCR版本相同。
+    """
+
+    # 两级识别的最终结果与单独使用PaddleOCR的结果分开缓存
+    cache_engine = "cascade"
+
+    def __init__(self, cpu_threads=None):
+        super().__init__(cpu_threads=cpu_threads)
+        # 第一级只需要ddddocr模型，字幕区域、缓存和字幕输出都使用PaddleOCR版本的
+        self.fast_ocr = ddddocr.DdddOcr()
+        self.previous_fast_text = None
+        self.fast_calls = 0
+        self.heavy_calls = 0
+        self.agreements = 0
+
+    def _is_similar(self, text, other):
+        return SequenceMatcher(None, text, other).ratio() >= CASCADE_NEIGHBOR_SIMILARITY
+
+    def needs_heavy(self, text, confidence, neighbours):
+        """判断ddddocr的识别结果是否需要交给PaddleOCR复核"""
+        if not text:
+            return True
+        if confidence is not None and confidence < CASCADE_MIN_CONFIDENCE:
+            return True
+        return any(
+            neighbour and neighbour != text and self._is_similar(text, neighbour)
+            for neighbour in neighbours
+        )
+
+    def process_bands_scored(self, bands):
+        """批量识别多个字幕区域，返回与输入顺序对应的 (文本, 置信度) 列表
+
+        置信度来自最终采用的那一级OCR，复用上一帧或缓存结果的区域为None。
+        """
+        texts = []
+        candidates = []  # 实际送入OCR的 (字幕区域, ddddocr文本, 置信度)
+        keys = []
+        try:
+            for img_array in bands:
+                mask = binarize_band(img_array)
+                hit, text = self.change_detector.lookup(mask)
+                if not hit:
+                    key = self.cache.key(mask)
+                    cached, text = self.cache.get(key)
+                    if not cached:
+                        fast_text, confidence = recognize_mask(self.fast_ocr, mask)
+                        fast_text = self.clean_text(fast_text)
+                        self.fast_calls += 1
+                        text = _PendingText(len(candidates))
+                        candidates.append((img_array, fast_text, confidence))
+                        keys.append(key)
+                    self.change_detector.update(mask, text, cached)
+                texts.append(text)
+
+            # 与前后相邻的识别结果比较，找出需要复核的字幕区域
+            fast_texts = [self.previous_fast_text] + [fast_text for _, fast_text, _ in candidates] + [None]
+            final = [(fast_text, confidence) for _, fast_text, confidence in candidates]
+            heavy = [
+                j for j, (_, fast_text, confidence) in enumerate(candidates)
+                if self.needs_heavy(fast_text, confidence, (fast_texts[j], fast_texts[j + 2]))
+            ]
+            if candidates:
+                self.previous_fast_text = candidates[-1][1]
+
+            if heavy:
+                results = self.recognize_bands([candidates[j][0] for j in heavy])
+                self.heavy_calls += len(heavy)
+                for j, (text, score) in zip(heavy, results):
+                    if text == final[j][0]:
+                        self.agreements += 1
+                    final[j] = (text, score)
+            self.cache.put_many((key, text) for key, (text, _) in zip(keys, final))
+
+            if isinstance(self.change_detector.previous_text, _PendingText):
+                self.change_detector.previous_text = final[self.change_detector.previous_text.index][0]
+            return [
+                final[text.index] if isinstance(text, _PendingText) else (text, None)
+                for text in texts
+            ]
+
+        except Exception as e:
+            print("Error recognizing subtitle bands:")
+            traceback.print_exc()
+            self.change_detector.reset()
+            return [(None, None)] * len(bands)
+
+    def report(self):
+        """输出OCR调用统计和两级识别结果的一致率"""
+        super().report()
+        if self.fast_calls:
+            agreement = f"{self.agreements / self.heavy_calls:.1%}" if self.heavy_calls else "-"
+            print(
+                f"Cascade OCR: ddddocr {self.fast_calls} calls, PaddleOCR {self.heavy_calls} calls "
+                f"({self.heavy_calls / self.fast_calls:.1%} escalated), agreement on escalated bands: {agreement}"
+            )
@@ -4,20 +4,33 @@ from PIL import Image
 Image.ANTIALIAS = Image.Resampling.LANCZOS
 
 import numpy as np
-import json
 import re
-from collections import defaultdict
 from paddleocr import PaddleOCR
 import traceback
 import logging
 from params import (
     USE_GPU_OCR, GPU_MEMORY_OCR, 
-    OCR_MODEL_DIR
+    OCR_MODEL_DIR, OCR_BATCH_SIZE
 )
+from subtitle_band import binarize_band
+from subtitle_extractor import SubtitleExtractorBase
 
-class SubtitleExtractor:
-    def __init__(self):
+
+class _PendingText:
+    """批量识别时占位，指向本批识别结果中的位置"""
+
+    def __init__(self, index):
+        self.index = index
+
+
+class SubtitleExtractor(SubtitleExtractorBase):
+    # 子类的识别结果与单独使用PaddleOCR的结果分开缓存
+    cache_engine = "paddle"
+
+    def __init__(self, cpu_threads=None):
         logging.disable(logging.WARNING)
+        # 多进程OCR时限制每个进程的CPU线程数，避免线程过多互相争抢
+        thread_options = {"cpu_threads": cpu_threads} if cpu_threads else {}
         self.ocr = PaddleOCR(
             use_angle_cls=False,
             lang="ch",
@@ -27,13 +40,13 @@ class SubtitleExtractor:
             use_gpu=USE_GPU_OCR,
             gpu_mem=GPU_MEMORY_OCR if USE_GPU_OCR else None,
             enable_mkldnn=True,
+            rec_batch_num=OCR_BATCH_SIZE,
             det=False, 
-            cls=False
+            cls=False,
+            **thread_options
         )
-        
-        self.subtitle_area = (235, 900, 235 + 1200, 900 + 90)
+        super().__init__()
         self.pattern = r'([^_]+)_(\d+m\d+s)_sim_(\d+\.\d+)'
-        self.subtitles_dict = defaultdict(list)
 
     def clean_text(self, text):
         """使用正则清理文本末尾的标点符号和多余空格"""
@@ -43,57 +56,127 @@ class SubtitleExtractor:
         # 匹配末尾的：中文标点、英文标点、空格
         return re.sub(r'[\u3000-\u303F\uFF00-\uFFEF\u2000-\u206F.,!?;:\s]+$', '', text.strip())
 
-    def parse_timestamp(self, timestamp):
-        """将时间戳 (如 "2m28s") 转换为总秒数"""
-        match = re.match(r'(\d+)m(\d+)s', timestamp)
-        if match:
-            minutes, seconds = map(int, match.groups())
-            return minutes * 60 + seconds
-        return 0
+    def _parse_result(self, item):
+        """从识别结果 (text, score) 中取出清理后的文本"""
+        text = item
+        if isinstance(text, (list, tuple)):
+            text = text[0]
+        if isinstance(text, (list, tuple)):
+            text = text[0]
+        if text is None:
+            return None
+        return self.clean_text(str(text).strip())
 
-    def process_image(self, img_path):
+    def _parse_score(self, item):
+        """从识别结果 (text, score) 中取出置信度"""
+        while isinstance(item, (list, tuple)) and item and isinstance(item[0], (list, tuple)):
+            item = item[0]
+        if isinstance(item, (list, tuple)) and len(item) > 1:
+            return float(item[1])
+        return 0.0
+
+    def recognize_bands(self, bands):
+        """直接识别一批字幕区域（不经过变化检测），返回 (文本, 置信度) 列表"""
+        # 直接调用识别模型，按rec_batch_num分批推理，每个区域返回一个 (文本, 置信度)
+        # PaddleOCR.ocr(det=False) 对列表逐张识别并按图片嵌套返回，不能用于批量识别
+        rec_res, _ = self.ocr.text_recognizer(list(bands))
+        assert len(rec_res) == len(bands), f"expected {len(bands)} results, got {len(rec_res)}"
+        return [(self._parse_result(item), self._parse_score(item)) for item in rec_res]
+
+    def process_bands(self, bands):
+        """批量识别多个字幕区域，返回与输入顺序对应的文本列表"""
+        return [text for text, _ in self.process_bands_scored(bands)]
+
+    def process_bands_scored(self, bands):
+        """批量识别多个字幕区域，返回与输入顺序对应的 (文本, 置信度) 列表
+
+        空白或与上一帧相同的区域不送入OCR，其余区域合并为一次识别调用。
+        复用上一帧或缓存结果的区域没有置信度，为None。
+        """
+        texts = []
+        batch = []
+        keys = []
+        try:
+            for img_array in bands:
+                # 字幕区域与上一帧相同时直接复用识别结果
+                mask = binarize_band(img_array)
+                hit, text = self.change_detector.lookup(mask)
+                if not hit:
+                    # 之前识别过相同的字幕时直接使用缓存结果
+                    key = self.cache.key(mask)
+                    cached, text = self.cache.get(key)
+                    if not cached:
+                        text = _PendingText(len(batch))
+                        batch.append(img_array)
+                        keys.append(key)
+                    self.change_detector.update(mask, text, cached)
+                texts.append(text)
+
+            recognized = self.recognize_bands(batch) if batch else []
+            self.cache.put_many((key, text) for key, (text, _) in zip(keys, recognized))
+
+            if isinstance(self.change_detector.previous_text, _PendingText):
+                self.change_detector.previous_text = recognized[self.change_detector.previous_text.index][0]
+            return [
+                recognized[text.index] if isinstance(text, _PendingText) else (text, None)
+                for text in texts
+            ]
+
+        except Exception as e:
+            print("Error recognizing subtitle bands:")
+            traceback.print_exc()
+            self.change_detector.reset()
+            return [(None, None)] * len(bands)
+
+    def process_band(self, img_array):
+        """对已裁剪的字幕区域进行文字识别"""
+        return self.process_bands([img_array])[0]
+
+    def load_band(self, img_path):
+        """读取帧图片并裁剪字幕区域"""
         try:
             img = Image.open(img_path)
             
-            if img.size != (1920, 1080):
-                raise ValueError("Incorrect image size")
-            
             # 裁剪字幕区域
-            subtitle_img = img.crop(self.subtitle_area)
+            subtitle_img = img.convert('RGB').crop(self.roi.area_for(img.height, img.width))
             
             # 将PIL Image转换为numpy数组
             img_array = np.array(subtitle_img)
             
-            # 只进行文字识别
-            result = self.ocr.ocr(img_array, det=False, cls=False)
-            
             # 释放内存
             img.close()
             subtitle_img.close()
-            del img, subtitle_img, img_array
+            del img, subtitle_img
             
-            if result:
-                text = result[0]
-                if isinstance(text, (list, tuple)):
-                    text = text[0]
-                if isinstance(text, (list, tuple)):
-                    text = text[0]
-                    
-                text = str(text).strip()
-                text = self.clean_text(text)
-                return text
-            return None
+            return img_array
             
         except Exception as e:
             print(f"Error processing image {img_path}:")
             traceback.print_exc()
             return None
 
+    def process_image(self, img_path):
+        img_array = self.load_band(img_path)
+        if img_array is None:
+            return None
+        return self.process_band(img_array)
+
+    def _flush_batch(self, pending):
+        """识别一批 (视频标题, 时间戳, 相似度, 字幕区域) 并按顺序记录字幕"""
+        if not pending:
+            return
+        results = self.process_bands_scored([item[3] for item in pending])
+        for (video_title, timestamp, similarity, _), (text, confidence) in zip(pending, results):
+            self.add_subtitle(video_title, timestamp, similarity, text, confidence=confidence)
+
     def process_frames(self, input_folder, output_folder):
         """处理文件夹中的所有帧并生成字幕"""
         if not os.path.exists(output_folder):
             os.makedirs(output_folder)
 
+        self.writer.folder = output_folder
+        pending = []
+        current_title = None
         for filename in sorted(os.listdir(input_folder)):
             if not filename.endswith(('.jpg', '.png')):
                 continue
@@ -105,37 +188,29 @@ class SubtitleExtractor:
             title, timestamp, similarity = match.groups()
             video_title = f"{title}"
             print(f"处理文件: {filename}")
+
+            # 帧按文件名排序，同一视频的帧连续出现，切换到下一个视频时保存上一个
+            if current_title is not None and video_title != current_title:
+                self._flush_batch(pending)
+                pending = []
+                self.save_subtitles(output_folder, current_title)
+            current_title = video_title
             
             img_path = os.path.join(input_folder, filename)
-            text = self.process_image(img_path)
-            
-            if not text:
+            img_array = self.load_band(img_path)
+            if img_array is None:
                 continue
+            pending.append((video_title, timestamp, similarity, img_array))
 
-            print(f"识别到文本: {text}")
-            
-            # 检查重复
-            subtitles = self.subtitles_dict[video_title]
-            if subtitles and subtitles[-1]["text"] == text:
-                continue
-            
-            # 添加字幕
-            self.subtitles_dict[video_title].append({
-                "timestamp": timestamp,
-                "similarity": float(similarity),
-                "text": text
-            })
+            # 攒够一批后统一识别
+            if len(pending) >= OCR_BATCH_SIZE:
+                self._flush_batch(pending)
+                pending = []
+
+        self._flush_batch(pending)
 
         # 保存字幕文件
-        for video_title, subtitles in self.subtitles_dict.items():
-            sorted_subtitles = sorted(subtitles, key=lambda x: self.parse_timestamp(x["timestamp"]))
-            output_json = os.path.join(output_folder, f"{video_title}.json")
-            
-            try:
-                with open(output_json, 'w', encoding='utf-8') as f:
-                    json.dump(sorted_subtitles, f, ensure_ascii=False, indent=4)
-                print(f"成功保存 {video_title} 的字幕")
-            except Exception as e:
-                print(f"保存文件时出错: {str(e)}")
-
-        print("\n处理完成")
\ No newline at end of file
+        self.save_subtitles(output_folder)
+        self.report()
+
+        print("\n处理完成")
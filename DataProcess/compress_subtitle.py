@@ -1,9 +1,16 @@
 import json
 import os
+import sys
 import gzip
 import base64
+import hashlib
+import argparse
 from pathlib import Path
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from subtitle_corpus import load_corpus
+from ngram_index import write_ngram_index
+
 def optimize_subtitle_database():
     subtitle_dir = Path("subtitle")
     output_file = Path("subtitle_db.gz")
@@ -13,26 +20,21 @@ def optimize_subtitle_database():
     output_file.parent.mkdir(exist_ok=True)
     all_subtitles = []
     
-    for json_file in subtitle_dir.glob("*.json"):
-        try:
-            with open(json_file, "r", encoding="utf-8") as f:
-                data = json.load(f)
-            
-            filename = json_file.name
-            episode_match = filename.split("]")[0].replace("[P", "")
-            episode_num = int(episode_match) if episode_match.isdigit() else 0
- 
-            for item in data:
-                all_subtitles.append({
-                    "e": episode_num,               
-                    "f": filename,                 
-                    "t": item.get("timestamp", ""),  
-                    "s": item.get("similarity", 0),  
-                    "x": item.get("text", "")
-                })
-            
-        except Exception as e:
-            print(e)
+    # 从列式字幕库读取，集数已在生成字幕库时解析
+    corpus = load_corpus(str(subtitle_dir))
+    for file_id, (title, data) in enumerate(corpus.iter_files()):
+        filename = f"{title}.json"
+        episode_num = int(corpus.file_episode[file_id])
+
+        for item in data:
+            all_subtitles.append({
+                "e": episode_num,               
+                "f": filename,                 
+                "t": item["timestamp"],  
+                "s": item["similarity"],  
+                "x": item["text"]
+            })
+    corpus.close()
     
     json_data = json.dumps(all_subtitles, ensure_ascii=False)
     compressed_data = gzip.compress(json_data.encode('utf-8'), compresslevel=9)
@@ -40,5 +42,122 @@ def optimize_subtitle_database():
     with open(output_file, "wb") as f:
         f.write(compressed_data)
 
+    # 文档号与subtitle_db中的下标一致
+    index_size = write_ngram_index([item["x"] for item in all_subtitles], "subtitle_ngram.idx")
+    print(f"Wrote n-gram index subtitle_ngram.idx ({index_size / 1e6:.2f} MB)")
+
+
+# v2格式：subtitle_db_v2/manifest.json 加上 chunks/ 下按内容哈希命名的分块
+#
+# manifest.json（不压缩）:
+#   {"version": 2, "codec": "gzip"|"br"|"zstd", "count": 总条数,
+#    "files": [[文件名, 集数], ...],
+#    "chunks": [{"name": "chunks/<哈希>.json.gz", "hash": "<sha256>", "count": 条数, "bytes": 压缩后字节数}, ...]}
+# 每个分块解压后是一个JSON对象，按列存放：
+#   {"r": [[文件序号, 条数], ...],  连续属于同一文件的字幕合并为一段
+#    "t": [秒, ...], "s": [相似度, ...], "x": [文本, ...]}
+# 分块文件名由未压缩内容的哈希决定，内容不变的分块地址也不变，客户端只需下载哈希有变化的分块。
+CODEC_EXTENSIONS = {"gzip": ".gz", "br": ".br", "zstd": ".zst"}
+
+
+def compress_chunk(data, codec, level):
+    """按指定算法压缩，brotli和zstd为可选依赖"""
+    if codec == "gzip":
+        return gzip.compress(data, compresslevel=level if level is not None else 9, mtime=0)
+    if codec == "br":
+        try:
+            import brotli
+        except ImportError:
+            raise RuntimeError("brotli codec requires: pip install brotli")
+        return brotli.compress(data, quality=level if level is not None else 11)
+    if codec == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise RuntimeError("zstd codec requires: pip install zstandard")
+        return zstandard.ZstdCompressor(level=level if level is not None else 19).compress(data)
+    raise ValueError(f"Unknown codec: {codec}")
+
+
+def _chunk_ranges(corpus, chunk_size):
+    """chunk_size为0时每个文件一块，否则按固定条数分块"""
+    if chunk_size:
+        for start in range(0, len(corpus), chunk_size):
+            yield start, min(start + chunk_size, len(corpus))
+    else:
+        for file_id in range(len(corpus.titles)):
+            start, stop = corpus.file_rows(file_id)
+            if stop > start:
+                yield start, stop
+
+
+def export_subtitle_database_v2(subtitle_dir="subtitle", output_dir="subtitle_db_v2", codec="gzip", level=None, chunk_size=0):
+    """导出分块、字典编码、按内容哈希版本化的网页字幕数据库"""
+    output_dir = Path(output_dir)
+    chunk_dir = output_dir / "chunks"
+    chunk_dir.mkdir(parents=True, exist_ok=True)
+    extension = CODEC_EXTENSIONS[codec]
+
+    corpus = load_corpus(str(subtitle_dir))
+    files = [[f"{title}.json", int(episode)] for title, episode in zip(corpus.titles, corpus.file_episode)]
+    chunks = []
+    written = 0
+    for start, stop in _chunk_ranges(corpus, chunk_size):
+        file_ids = corpus.file[start:stop].tolist()
+        # 连续属于同一文件的字幕编码为 [文件序号, 条数]
+        boundaries = [0] + [k for k in range(1, len(file_ids)) if file_ids[k] != file_ids[k - 1]] + [len(file_ids)]
+        chunk = {
+            "r": [[int(file_ids[a]), b - a] for a, b in zip(boundaries, boundaries[1:])],
+            "t": (corpus.time_ms[start:stop] // 1000).tolist(),
+            "s": [round(float(value), 4) for value in corpus.similarity[start:stop]],
+            "x": corpus.texts(start, stop),
+        }
+        data = json.dumps(chunk, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        name = f"chunks/{digest[:20]}.json{extension}"
+        path = output_dir / name
+        if not path.exists():
+            # 同名分块内容相同，已存在时不必重写
+            tmp_path = path.with_suffix(path.suffix + ".tmp")
+            tmp_path.write_bytes(compress_chunk(data, codec, level))
+            os.replace(tmp_path, path)
+            written += 1
+        chunks.append({"name": name, "hash": digest, "count": stop - start, "bytes": path.stat().st_size})
+    count = len(corpus)
+    # 文档号为各分块依次拼接后的序号
+    index_size = write_ngram_index(corpus.texts(), str(output_dir / "ngram.idx"))
+    corpus.close()
+
+    manifest = {"version": 2, "codec": codec, "count": count, "files": files, "chunks": chunks}
+    tmp_manifest = output_dir / "manifest.json.tmp"
+    tmp_manifest.write_text(json.dumps(manifest, ensure_ascii=False, separators=(",", ":")), encoding="utf-8")
+    os.replace(tmp_manifest, output_dir / "manifest.json")
+
+    # 清理不再被清单引用的旧分块
+    referenced = {Path(chunk["name"]).name for chunk in chunks}
+    removed = 0
+    for path in chunk_dir.iterdir():
+        if path.name not in referenced:
+            path.unlink()
+            removed += 1
+
+    total = sum(chunk["bytes"] for chunk in chunks)
+    print(
+        f"Exported {count} subtitles in {len(chunks)} chunks ({total / 1e6:.2f} MB, {codec}): "
+        f"{written} new, {len(chunks) - written} unchanged, {removed} removed; "
+        f"n-gram index {index_size / 1e6:.2f} MB"
+    )
+
+
 if __name__ == "__main__":
-    optimize_subtitle_database() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="打包网页端使用的字幕数据库")
+    parser.add_argument("--v2", action="store_true", help="导出分块的v2格式，而不是单个subtitle_db.gz")
+    parser.add_argument("--output", default="subtitle_db_v2", help="v2格式的输出文件夹")
+    parser.add_argument("--codec", default="gzip", choices=sorted(CODEC_EXTENSIONS), help="v2分块的压缩算法")
+    parser.add_argument("--level", type=int, default=None, help="压缩级别，默认为各算法的最高级别")
+    parser.add_argument("--chunk-size", type=int, default=0, help="每块的字幕条数，0表示每个视频一块")
+    args = parser.parse_args()
+    if args.v2:
+        export_subtitle_database_v2("subtitle", args.output, args.codec, args.level, args.chunk_size)
+    else:
+        optimize_subtitle_database() 
\ No newline at end of file
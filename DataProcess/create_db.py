@@ -1,13 +1,14 @@
 import sqlite3
 import os
 
-def create_subtitle_database():
-    # 如果数据库文件存在，先删除它
-    if os.path.exists('subtitles.db'):
-        os.remove('subtitles.db')
+def create_subtitle_database(db_path='subtitles.db', rebuild=False):
+    # 默认保留已有的数据库，导入时整体替换其中的字幕；rebuild为True时删除重建
+    if rebuild and os.path.exists(db_path):
+        os.remove(db_path)
         print("已删除旧的数据库文件")
+    existed = os.path.exists(db_path)
     
-    conn = sqlite3.connect('subtitles.db')
+    conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
     
     # 创建字幕表
@@ -21,12 +22,12 @@ def create_subtitle_database():
     )
     ''')
     
-    # 创建全文搜索索引
+    # 创建全文搜索索引，内容取自subtitles表，文本不重复保存；只对字幕文本建立索引
     cursor.execute('''
     CREATE VIRTUAL TABLE IF NOT EXISTS subtitles_fts USING fts5(
-        episode_title,
-        timestamp,
-        similarity,
+        episode_title UNINDEXED,
+        timestamp UNINDEXED,
+        similarity UNINDEXED,
         text,
         content='subtitles',
         content_rowid='id'
@@ -35,4 +36,4 @@ def create_subtitle_database():
     
     conn.commit()
     conn.close()
-    print("已创建新的数据库文件") 
\ No newline at end of file
+    print("使用已有的数据库文件" if existed else "已创建新的数据库文件")
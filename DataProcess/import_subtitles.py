@@ -1,30 +1,58 @@
-import json
 import sqlite3
 import os
+import sys
+import time
 
-def import_subtitles(subtitle_dir):
-    conn = sqlite3.connect('subtitles.db')
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from subtitle_corpus import load_corpus, format_timestamp
+
+def subtitle_rows(corpus):
+    """逐条产出 (剧集, 时间戳, 相似度, 文本)，不在内存中展开整个字幕库"""
+    titles = corpus.titles
+    for file_id, title in enumerate(titles):
+        start, stop = corpus.file_rows(file_id)
+        if stop == start:
+            continue
+        texts = corpus.texts(start, stop)
+        seconds = (corpus.time_ms[start:stop] // 1000).tolist()
+        similarities = corpus.similarity[start:stop].tolist()
+        for second, similarity, text in zip(seconds, similarities, texts):
+            yield title, format_timestamp(second), round(similarity, 4), text
+
+def import_subtitles(subtitle_dir, db_path='subtitles.db'):
+    conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
+    # 导入期间使用WAL并关闭同步，导入中断时数据库仍保持导入前的内容
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=OFF')
     
-    for filename in os.listdir(subtitle_dir):
-        if filename.endswith('.json'):
-            episode_title = os.path.splitext(filename)[0]
-            
-            with open(os.path.join(subtitle_dir, filename), 'r', encoding='utf-8') as f:
-                subtitles = json.load(f)
-                
-            for subtitle in subtitles:
-                # 插入到主表
-                cursor.execute('''
-                INSERT INTO subtitles (episode_title, timestamp, similarity, text)
-                VALUES (?, ?, ?, ?)
-                ''', (episode_title, subtitle['timestamp'], subtitle['similarity'], subtitle['text']))
-                
-                # 同步插入到全文搜索表
-                cursor.execute('''
-                INSERT INTO subtitles_fts (episode_title, timestamp, similarity, text)
-                VALUES (?, ?, ?, ?)
-                ''', (episode_title, subtitle['timestamp'], subtitle['similarity'], subtitle['text']))
+    # 从列式字幕库读取，不再逐个解析字幕JSON
+    corpus = load_corpus(subtitle_dir)
+    start_time = time.perf_counter()
+    try:
+        # 在一个事务中整体替换字幕
+        cursor.execute('BEGIN')
+        cursor.execute('DELETE FROM subtitles')
+        cursor.executemany('''
+        INSERT INTO subtitles (episode_title, timestamp, similarity, text)
+        VALUES (?, ?, ?, ?)
+        ''', subtitle_rows(corpus))
+        count = cursor.execute('SELECT COUNT(*) FROM subtitles').fetchone()[0]
+        
+        # 全文搜索表的内容取自subtitles表，一次性重建索引
+        cursor.execute("INSERT INTO subtitles_fts(subtitles_fts) VALUES('rebuild')")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        corpus.close()
+    elapsed = time.perf_counter() - start_time
     
-    conn.commit()
-    conn.close() 
\ No newline at end of file
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    # 恢复为单文件的回滚日志模式，数据库可以作为单个文件复制或只读部署
+    cursor.execute('PRAGMA journal_mode=DELETE')
+    conn.close()
+    print(f"导入 {count} 条字幕，用时 {elapsed:.1f} 秒（{count / max(elapsed, 1e-9):.0f} 条/秒）")
+    return count
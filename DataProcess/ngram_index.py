@@ -0,0 +1,330 @@
+import os
+import sys
+import time
+import random
+import struct
+import argparse
+from collections import Counter, defaultdict
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from subtitle_corpus import load_corpus
+
+# 字符n-gram倒排索引，供网页端只对候选字幕计算匹配率
+#
+# 同时索引单字和相邻两字：单字匹配率(lcsRatio)按子序列计算，只能用单字过滤；
+# 多关键词匹配率(multiWordLcsRatio)要求关键词整体出现，可以用两字过滤。
+# 文本先转为小写。文档号是字幕在 subtitle_db 数组中的下标，也就是v2分块依次拼接后的序号。
+#
+# 二进制格式（小端序）：
+#   0   8字节       魔数 "VVNGRAM1"
+#   8   uint32      文档数 N
+#   12  uint32      gram数 G
+#   16  uint32      gram文本总字节数 K
+#   20  uint32      postings总字节数 P
+#   24  K字节       各gram的UTF-8文本依次拼接，按UTF-8字节序排序
+#       补0到4字节对齐
+#       uint32[G+1] gram文本偏移：第g个gram为 文本[keyOffsets[g], keyOffsets[g+1])
+#       uint32[G]   每个gram出现的文档数
+#       uint32[G+1] postings偏移：第g个gram的postings为 postings[postingOffsets[g], postingOffsets[g+1])
+#       P字节       postings：文档号升序排列，第一个写文档号，之后写与前一个的差，
+#                   每个数用LEB128变长编码（每字节低7位，最高位为1表示后面还有字节）
+# 对齐后JS可直接用 new Uint32Array(buffer, offset, length) 读取三张表。
+MAGIC = b"VVNGRAM1"
+_HEADER = struct.Struct("<8sIIII")
+
+
+def text_grams(text):
+    """文本中出现的单字和相邻两字"""
+    text = text.lower()
+    grams = set(text)
+    grams.update(text[k:k + 2] for k in range(len(text) - 1))
+    return grams
+
+
+def varint_sizes(values):
+    """每个数LEB128编码后的字节数"""
+    values = np.asarray(values, dtype=np.uint64)
+    sizes = np.ones(len(values), dtype=np.int64)
+    for bits in (7, 14, 21, 28, 35):
+        sizes += values >= (1 << bits)
+    return sizes
+
+
+def encode_varints(values):
+    """LEB128编码一组非负整数"""
+    values = np.asarray(values, dtype=np.uint64)
+    sizes = varint_sizes(values)
+    starts = np.cumsum(sizes) - sizes
+    out = np.zeros(int(sizes.sum()), dtype=np.uint8)
+    for k in range(int(sizes.max()) if len(sizes) else 0):
+        mask = sizes > k
+        byte = (values[mask] >> np.uint64(7 * k)) & np.uint64(0x7f)
+        byte |= np.where(sizes[mask] > k + 1, 0x80, 0).astype(np.uint64)
+        out[starts[mask] + k] = byte.astype(np.uint8)
+    return out.tobytes()
+
+
+def decode_varints(data):
+    """解码LEB128编码的一组整数"""
+    data = np.frombuffer(data, dtype=np.uint8)
+    if len(data) == 0:
+        return np.zeros(0, dtype=np.int64)
+    ends = np.flatnonzero(data < 0x80)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    group = np.repeat(np.arange(len(ends)), ends - starts + 1)
+    shifts = (np.arange(len(data)) - starts[group]) * 7
+    parts = (data & 0x7f).astype(np.float64) * np.exp2(shifts)
+    return np.bincount(group, weights=parts, minlength=len(ends)).astype(np.int64)
+
+
+def build_ngram_index(texts):
+    """为按文档号排列的文本生成索引文件内容"""
+    postings = defaultdict(list)
+    for doc, text in enumerate(texts):
+        for gram in text_grams(text):
+            postings[gram].append(doc)
+
+    grams = sorted(postings, key=lambda gram: gram.encode('utf-8'))
+    keys = [gram.encode('utf-8') for gram in grams]
+    key_offsets = np.zeros(len(grams) + 1, dtype=np.uint32)
+    np.cumsum([len(key) for key in keys], out=key_offsets[1:])
+    doc_freq = np.array([len(postings[gram]) for gram in grams], dtype=np.uint32)
+
+    # 所有gram的差值一次编码：每个gram的第一个文档号减去0
+    docs = np.concatenate([np.array(postings[gram], dtype=np.int64) for gram in grams]) if grams else np.zeros(0, dtype=np.int64)
+    deltas = np.diff(docs, prepend=0)
+    firsts = np.cumsum(doc_freq.astype(np.int64)) - doc_freq
+    deltas[firsts] = docs[firsts]
+    encoded = encode_varints(deltas)
+    posting_offsets = np.zeros(len(grams) + 1, dtype=np.uint32)
+    if grams:
+        np.cumsum(np.add.reduceat(varint_sizes(deltas), firsts), out=posting_offsets[1:])
+
+    key_data = b"".join(keys)
+    padding = b"\0" * (-(_HEADER.size + len(key_data)) % 4)
+    return b"".join([
+        _HEADER.pack(MAGIC, len(texts), len(grams), len(key_data), int(posting_offsets[-1])),
+        key_data,
+        padding,
+        key_offsets.astype("<u4").tobytes(),
+        doc_freq.astype("<u4").tobytes(),
+        posting_offsets.astype("<u4").tobytes(),
+        encoded,
+    ])
+
+
+def write_ngram_index(texts, path):
+    data = build_ngram_index(texts)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return len(data)
+
+
+def lcs_ratio(query, text):
+    """与网页端lcsRatio相同：query作为子序列在text中能匹配的最大比例(%)"""
+    query = query.lower()
+    text = text.lower()
+    if not query or not text:
+        return 0
+    # 位并行LCS：v中为0的位数即LCS长度
+    masks = {}
+    for k, char in enumerate(query):
+        masks[char] = masks.get(char, 0) | (1 << k)
+    full = (1 << len(query)) - 1
+    v = full
+    for char in text:
+        u = v & masks.get(char, 0)
+        v = ((v + u) | (v - u)) & full
+    return (len(query) - bin(v).count("1")) / len(query) * 100
+
+
+def multi_word_lcs_ratio(query_words, text):
+    """与网页端multiWordLcsRatio相同：各关键词不重叠地整体出现的字数比例(%)"""
+    text = text.lower()
+    total = sum(len(word) for word in query_words)
+    if total == 0:
+        # 网页端此时得到NaN，任何匹配率要求都不满足
+        return float("nan")
+    used = [False] * len(text)
+    matched = 0
+    for word in query_words:
+        word = word.lower()
+        start = 0
+        while True:
+            pos = text.find(word, start)
+            if pos == -1:
+                break
+            end = pos + len(word)
+            if not any(used[pos:end]):
+                for k in range(pos, end):
+                    used[k] = True
+                matched += len(word)
+                break
+            start = pos + 1
+    return matched / total * 100
+
+
+def parse_query(query):
+    """与网页端相同的查询解析，返回 (是否多关键词, 关键词列表)"""
+    query = query.lower()
+    has_spaces = " " in query or "%20" in query
+    words = [word for word in query.replace("%20", " ").split() if word] if has_spaces else [query]
+    return has_spaces, words
+
+
+def match_ratio(query, text):
+    has_spaces, words = parse_query(query)
+    return multi_word_lcs_ratio(words, text) if has_spaces else lcs_ratio(query.lower(), text)
+
+
+class NgramIndex:
+    """索引文件的参考读取实现，与JS端读取方式一致"""
+
+    def __init__(self, data):
+        magic, self.doc_count, gram_count, key_bytes, posting_bytes = _HEADER.unpack_from(data, 0)
+        if magic != MAGIC:
+            raise ValueError("Not an n-gram index")
+        offset = _HEADER.size
+        key_data = data[offset:offset + key_bytes]
+        offset += key_bytes + (-(offset + key_bytes) % 4)
+        key_offsets = np.frombuffer(data, dtype="<u4", count=gram_count + 1, offset=offset)
+        offset += key_offsets.nbytes
+        self.doc_freq = np.frombuffer(data, dtype="<u4", count=gram_count, offset=offset)
+        offset += self.doc_freq.nbytes
+        self.posting_offsets = np.frombuffer(data, dtype="<u4", count=gram_count + 1, offset=offset)
+        offset += self.posting_offsets.nbytes
+        self.postings_data = data[offset:offset + posting_bytes]
+        self.grams = {
+            key_data[a:b].decode('utf-8'): g
+            for g, (a, b) in enumerate(zip(key_offsets[:-1].tolist(), key_offsets[1:].tolist()))
+        }
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            return cls(f.read())
+
+    def postings(self, gram):
+        """包含该gram的文档号（升序）"""
+        g = self.grams.get(gram)
+        if g is None:
+            return np.zeros(0, dtype=np.int64)
+        data = self.postings_data[self.posting_offsets[g]:self.posting_offsets[g + 1]]
+        return np.cumsum(decode_varints(data))
+
+    def _contains_word(self, word):
+        """包含该词全部n-gram的文档，是包含该词的文档的超集"""
+        grams = [word[k:k + 2] for k in range(len(word) - 1)] if len(word) > 1 else [word]
+        lists = sorted((self.postings(gram) for gram in set(grams)), key=len)
+        docs = lists[0]
+        for other in lists[1:]:
+            docs = np.intersect1d(docs, other, assume_unique=True)
+        return docs
+
+    def candidates(self, query, min_ratio=50):
+        """可能满足匹配率要求的文档号，匹配率的上界低于min_ratio的文档不会出现"""
+        has_spaces, words = parse_query(query)
+        if has_spaces:
+            # 一个关键词能被匹配，该词的全部两字组合都必须出现
+            total = sum(len(word) for word in words)
+            lengths = Counter(words)
+            docs = [self._contains_word(word) for word in lengths]
+            weights = [len(word) * count for word, count in lengths.items()]
+        else:
+            # 子序列匹配的字数不超过文本中出现过的查询字的个数
+            total = len(query)
+            counts = Counter(query.lower())
+            docs = [self.postings(char) for char in counts]
+            weights = list(counts.values())
+        if has_spaces and total == 0:
+            return np.zeros(0, dtype=np.int64)
+        if total == 0 or min_ratio <= 0:
+            return np.arange(self.doc_count)
+        scores = np.zeros(self.doc_count, dtype=np.int64)
+        for doc_ids, weight in zip(docs, weights):
+            scores[doc_ids] += weight
+        return np.flatnonzero(scores / total * 100 >= min_ratio)
+
+    def search(self, texts, query, min_ratio=50):
+        """只对候选文档计算匹配率，返回 [(文档号, 匹配率)]"""
+        results = []
+        for doc in self.candidates(query, min_ratio).tolist():
+            ratio = match_ratio(query, texts[doc])
+            if ratio >= min_ratio:
+                results.append((doc, ratio))
+        return results
+
+
+def full_scan(texts, query, min_ratio=50):
+    """对全部文档计算匹配率，作为索引结果的对照"""
+    results = []
+    for doc, text in enumerate(texts):
+        ratio = match_ratio(query, text)
+        if ratio >= min_ratio:
+            results.append((doc, ratio))
+    return results
+
+
+def sample_queries(texts, count, seed=0):
+    """从字幕中随机截取查询：单个词、多个关键词和带错字的词"""
+    rng = random.Random(seed)
+    queries = []
+    while len(queries) < count:
+        text = rng.choice(texts)
+        if len(text) < 4:
+            continue
+        start = rng.randrange(len(text) - 3)
+        word = text[start:start + rng.randint(2, 4)]
+        kind = len(queries) % 3
+        if kind == 1:
+            other = rng.choice(texts)
+            queries.append(f"{word} {other[:2]}" if len(other) >= 2 else word)
+        elif kind == 2:
+            queries.append(word[:-1] + rng.choice(texts)[0])
+        else:
+            queries.append(word)
+    return queries
+
+
+def verify(index_path, subtitle_dir="subtitle", queries=None, count=20, min_ratio=50):
+    """检查索引检索与全量扫描的结果完全一致，并输出两者的耗时"""
+    corpus = load_corpus(subtitle_dir)
+    texts = corpus.texts()
+    corpus.close()
+    index = NgramIndex.load(index_path)
+    if index.doc_count != len(texts):
+        raise ValueError(f"Index has {index.doc_count} documents, corpus has {len(texts)}")
+
+    queries = queries or sample_queries(texts, count)
+    scan_time = index_time = 0.0
+    mismatches = 0
+    for query in queries:
+        start = time.perf_counter()
+        expected = full_scan(texts, query, min_ratio)
+        scan_time += time.perf_counter() - start
+        start = time.perf_counter()
+        found = index.search(texts, query, min_ratio)
+        index_time += time.perf_counter() - start
+        candidates = len(index.candidates(query, min_ratio))
+        status = "OK" if found == expected else "MISMATCH"
+        mismatches += found != expected
+        print(f"{status} {query!r}: {len(found)} results, {candidates} candidates / {len(texts)}")
+    print(
+        f"{len(queries) - mismatches}/{len(queries)} queries match the full scan; "
+        f"full scan {scan_time:.2f}s, indexed {index_time:.2f}s"
+    )
+    return mismatches == 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="检查n-gram索引的检索结果与全量扫描一致")
+    parser.add_argument("index", nargs="?", default="subtitle_ngram.idx", help="索引文件")
+    parser.add_argument("--subtitles", default="subtitle", help="字幕JSON文件夹")
+    parser.add_argument("--query", action="append", help="要检查的查询，可重复；不指定时从字幕中随机抽取")
+    parser.add_argument("--count", type=int, default=20, help="随机抽取的查询数")
+    parser.add_argument("--min-ratio", type=float, default=50, help="最小匹配率")
+    args = parser.parse_args()
+    sys.exit(0 if verify(args.index, args.subtitles, args.query, args.count, args.min_ratio) else 1)
@@ -2,7 +2,7 @@ import dlib
 import cv2
 import numpy as np
 import os
-from sklearn.metrics.pairwise import cosine_similarity
+from face_gallery import FaceGallery
 
 
 class FaceRecognizer:
@@ -19,9 +19,10 @@ class FaceRecognizer:
         """从NPZ文件加载预计算的特征向量"""
         print(f"Loading pre-computed features from {features_file}")
         data = np.load(features_file)
-        self.known_face_encodings = data['encodings']
+        self.gallery = FaceGallery(data['encodings'])
+        self.known_face_encodings = self.gallery.matrix
         self.image_paths = data['image_paths']
-        print(f"Loaded {len(self.known_face_encodings)} face features")
+        print(f"Loaded {len(self.gallery)} face features")
 
     def extract_face_encodings(self, image):
         rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
@@ -36,20 +37,11 @@ class FaceRecognizer:
         return face_encodings
 
     def recognize_face(self, frame, threshold=0.6):
-        face_encoding = self.extract_face_encoding(frame)
+        max_similarity = self.get_face_similarity(frame)
 
-        if face_encoding is None:
+        if max_similarity is None:
             return False
 
-        # 计算与所有已知人脸的相似度
-        similarities = [cosine_similarity(face_encoding.reshape(1, -1),
-                                          known_encoding.reshape(1, -1))[0][0]
-                        for known_encoding in self.known_face_encodings]
-
-        if not similarities:
-            return False
-
-        max_similarity = max(similarities)
         return max_similarity > threshold
 
     def get_face_similarity(self, frame):
@@ -57,20 +49,10 @@ class FaceRecognizer:
         if not face_encodings:  # 如果没有检测到人脸
             return None
 
-        # 确保known_face_encodings不为空
-        if len(self.known_face_encodings) == 0:
-            return None
-
-        # 将已知特征向量转换为NumPy数组
-        known_encodings = np.array(self.known_face_encodings)
-
-        max_similarity = 0
-        for face_encoding in face_encodings:
-            # 计算余弦相似度
-            similarities = cosine_similarity(known_encodings, face_encoding.reshape(1, -1))
-            max_similarity = max(max_similarity, np.max(similarities))
+        # 一次矩阵乘法计算所有人脸与特征库的余弦相似度
+        max_similarity = self.gallery.max_similarity(face_encodings)
 
-        return max_similarity if max_similarity > 0 else None
+        return max_similarity if max_similarity is not None and max_similarity > 0 else None
 
     def process_video(self, video_path, fps=1, save_frames_folder="output_frames"):
         """处理视频，检测所有人脸，保存所有帧和相似度"""
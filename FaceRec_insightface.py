@@ -1,36 +1,122 @@
-import cv2
 import numpy as np
+import onnxruntime
 import os
 import traceback
-from typing import Optional, List
+from typing import Callable, Iterator, Optional, List, Tuple
 from insightface.app import FaceAnalysis
+from insightface.utils import face_align
 from numpy.typing import NDArray
 from PIL import Image
-from params import USE_GPU_FACE
+from params import (
+    USE_GPU_FACE, FACE_BATCH_SIZE,
+    FACE_TRACKING, FACE_TRACK_IOU, FACE_TRACK_REVERIFY, FACE_TRACK_MAX_MISSED, FACE_DETECT_INTERVAL,
+    SAVE_FACE_EMBEDDINGS, EMBEDDINGS_OUTPUT, SHOT_DETECT_INTERVAL, SUBTITLE_OUTPUT
+)
+from video_decoder import create_decoder
+from face_gallery import FaceGallery
+from face_embeddings import FaceEmbeddingStore, embeddings_path
+from shot_index import ShotDetector
 
 
-def cosine_similarity(A: NDArray, B: NDArray) -> NDArray:
-    """计算两组向量间的余弦相似度
-    Args:
-        A: shape (n_samples_1, n_features)
-        B: shape (n_samples_2, n_features)
-    Returns:
-        相似度矩阵: shape (n_samples_1, n_samples_2)
+def bbox_iou(A: NDArray, B: NDArray) -> NDArray:
+    """计算两组边框 (x1, y1, x2, y2) 间的IoU矩阵"""
+    x1 = np.maximum(A[:, None, 0], B[None, :, 0])
+    y1 = np.maximum(A[:, None, 1], B[None, :, 1])
+    x2 = np.minimum(A[:, None, 2], B[None, :, 2])
+    y2 = np.minimum(A[:, None, 3], B[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_A = (A[:, 2] - A[:, 0]) * (A[:, 3] - A[:, 1])
+    area_B = (B[:, 2] - B[:, 0]) * (B[:, 3] - B[:, 1])
+    union = area_A[:, None] + area_B[None, :] - inter
+    return inter / np.maximum(union, 1e-6)
+
+
+class FaceTrack:
+    """一条人脸轨迹，保存最近一次识别得到的相似度"""
+
+    def __init__(self, bbox: NDArray) -> None:
+        self.bbox = bbox
+        self.similarity: Optional[float] = None
+        self.embedding_index: Optional[int] = None  # 在FaceEmbeddingStore中的特征行号
+        self.since_verify = 0  # 距上次识别经过的采样帧数
+        self.missed = 0  # 连续未匹配到检测框的帧数
+        self.pending = False  # 已提交识别但尚未得到结果
+
+
+class FaceTracker:
+    """基于IoU的轻量人脸跟踪
+
+    新出现的轨迹或到达复核间隔的轨迹才需要重新识别，其余帧直接沿用轨迹上的相似度。
     """
-    # 计算 L2 范数
-    norm_A = np.linalg.norm(A, axis=1, keepdims=True)
-    norm_B = np.linalg.norm(B, axis=1, keepdims=True)
-    
-    # 归一化向量
-    A_normalized = A / norm_A
-    B_normalized = B / norm_B
-    
-    # 计算余弦相似度
-    return np.dot(A_normalized, B_normalized.T)
+
+    def __init__(
+        self,
+        enabled: bool = FACE_TRACKING,
+        iou_threshold: float = FACE_TRACK_IOU,
+        reverify_interval: int = FACE_TRACK_REVERIFY,
+        max_missed: int = FACE_TRACK_MAX_MISSED
+    ) -> None:
+        self.enabled = enabled
+        self.iou_threshold = iou_threshold
+        self.reverify_interval = reverify_interval
+        self.max_missed = max_missed
+        self.tracks: List[FaceTrack] = []
+
+    def reset(self) -> None:
+        self.tracks = []
+
+    def active_tracks(self) -> List[FaceTrack]:
+        return [track for track in self.tracks if track.missed == 0]
+
+    def skip_frame(self) -> List[FaceTrack]:
+        """不做检测的采样帧沿用当前轨迹，复核间隔仍按采样帧计数"""
+        tracks = self.active_tracks()
+        for track in tracks:
+            track.since_verify += 1
+        return tracks
+
+    def update(self, bboxes: NDArray) -> List[FaceTrack]:
+        """将当前帧的检测框关联到轨迹，返回与检测框一一对应的轨迹"""
+        if not self.enabled:
+            return [FaceTrack(bbox) for bbox in bboxes]
+
+        assigned: List[Optional[FaceTrack]] = [None] * len(bboxes)
+        matched = set()
+        if len(bboxes) and self.tracks:
+            ious = bbox_iou(bboxes, np.array([track.bbox for track in self.tracks]))
+            # 按IoU从大到小贪心匹配
+            for flat in np.argsort(-ious, axis=None):
+                i, j = np.unravel_index(flat, ious.shape)
+                if ious[i, j] < self.iou_threshold:
+                    break
+                if assigned[i] is not None or j in matched:
+                    continue
+                track = self.tracks[j]
+                track.bbox = bboxes[i]
+                track.missed = 0
+                track.since_verify += 1
+                assigned[i] = track
+                matched.add(j)
+
+        for j, track in enumerate(self.tracks):
+            if j not in matched:
+                track.missed += 1
+        self.tracks = [track for track in self.tracks if track.missed <= self.max_missed]
+
+        for i, bbox in enumerate(bboxes):
+            if assigned[i] is None:
+                assigned[i] = FaceTrack(bbox)
+                self.tracks.append(assigned[i])
+        return assigned
+
+    def needs_recognition(self, track: FaceTrack) -> bool:
+        if track.pending:
+            return False
+        return track.similarity is None or track.since_verify >= self.reverify_interval
 
 
 class FaceRecognizer:
-    def __init__(self, features_file: str) -> None:
+    def __init__(self, features_file: str, cpu_threads: Optional[int] = None) -> None:
         providers = ['CPUExecutionProvider']
         if USE_GPU_FACE:
             providers.insert(0, 'CUDAExecutionProvider')
@@ -39,137 +125,305 @@ class FaceRecognizer:
             name='buffalo_l',
             providers=providers
         )
+        if cpu_threads:
+            self.limit_threads(cpu_threads)
         self.app.prepare(ctx_id=0, det_size=(640, 640))
+        self.rec_model = self.app.models['recognition']
+        self.tracker = FaceTracker()
+        self.frames_since_detect = 0
+        self.recognized_faces = 0
+        self.tracked_faces = 0
+        self.embedding_store = FaceEmbeddingStore() if SAVE_FACE_EMBEDDINGS else None
+        self.shot_detector = ShotDetector()
     
-        self.stored_features = np.load(features_file)
-        self.known_face_encodings = self.stored_features['encodings']
-        
-        if USE_GPU_FACE:
-            import torch
-            self.known_face_encodings = torch.tensor(
-                self.known_face_encodings, 
-                device='cuda'
-            ).float()
-            self.use_cuda = True
-        else:
-            self.use_cuda = False
+        self.use_cuda = USE_GPU_FACE
+        self.load_features(features_file)
 
+    def limit_threads(self, cpu_threads: int) -> None:
+        """限制各模型的onnxruntime线程数，多进程处理视频时避免每个进程都按全部核数开线程
+
+        FaceAnalysis不会把SessionOptions传给模型，这里用相同的模型文件和执行后端重建会话。
+        """
+        sess_options = onnxruntime.SessionOptions()
+        sess_options.intra_op_num_threads = cpu_threads
+        sess_options.inter_op_num_threads = 1
+        for model in self.app.models.values():
+            model.session = onnxruntime.InferenceSession(
+                model.model_file,
+                sess_options=sess_options,
+                providers=model.session.get_providers()
+            )
 
     def load_features(self, features_file: str) -> None:
         try:
-            data = np.load(features_file)
-            self.known_face_encodings = data['encodings']
-            print(f"Successfully loaded {len(self.known_face_encodings)} face features")
+            self.gallery = FaceGallery.load(
+                features_file,
+                device='cuda' if self.use_cuda else None
+            )
+            print(f"Successfully loaded {len(self.gallery)} face features")
         except Exception as e:
             print(f"Error loading features:")
             traceback.print_exc()
             raise
 
-    def extract_face_encodings(self, image: NDArray) -> List[NDArray]:
-        """提取人脸特征编码"""
+    def detect_faces(self, image: NDArray) -> Tuple[NDArray, NDArray]:
+        """检测人脸，返回边框 (N, 4) 和关键点 (N, 5, 2)"""
         try:
-            faces = self.app.get(image)
-            return [face.embedding for face in faces] if faces else []
+            bboxes, kpss = self.app.det_model.detect(image, max_num=0, metric='default')
         except Exception as e:
-            print("Error extracting face encodings:")
+            print("Error detecting faces:")
             traceback.print_exc()
-            return []
+            bboxes, kpss = None, None
+        if kpss is None or bboxes is None or len(bboxes) == 0:
+            return np.zeros((0, 4), dtype=np.float32), np.zeros((0, 5, 2), dtype=np.float32)
+        return bboxes[:, :4], kpss
+
+    def get_face_similarities(
+        self,
+        frames: List[NDArray],
+        timestamps: Optional[List[int]] = None
+    ) -> List[Optional[float]]:
+        """批量计算多帧的人脸相似度
+
+        逐帧检测并跟踪人脸，只有新出现或需要复核的轨迹才裁剪人脸，
+        所有帧中待识别的人脸一次性送入识别模型批量提取特征。
+        传入各帧的秒数时同时记录人脸特征，供更换特征库后重新计算相似度，
+        并按镜头切换重置跟踪，同一镜头内的帧视为等价，以更大的间隔检测人脸。
+        """
+        crops = []
+        targets = []
+        frame_tracks = []
+        detect_interval = FACE_DETECT_INTERVAL
+        use_shots = self.shot_detector.enabled and timestamps is not None
+        if use_shots:
+            detect_interval = max(detect_interval, SHOT_DETECT_INTERVAL)
+        for i, frame in enumerate(frames):
+            if use_shots and self.shot_detector.is_new_shot(timestamps[i], frame):
+                # 上一个镜头的人脸轨迹不再有效
+                self.tracker.reset()
+                self.frames_since_detect = 0
+
+            # 按间隔跳过检测时沿用上一次检测到的轨迹
+            if self.frames_since_detect % detect_interval != 0 and self.tracker.enabled:
+                self.frames_since_detect += 1
+                frame_tracks.append(self.tracker.skip_frame())
+                continue
+            self.frames_since_detect += 1
+
+            bboxes, kpss = self.detect_faces(frame)
+            tracks = self.tracker.update(bboxes)
+            for track, kps in zip(tracks, kpss):
+                if self.tracker.needs_recognition(track):
+                    track.pending = True
+                    track.since_verify = 0
+                    crops.append(face_align.norm_crop(frame, landmark=kps, image_size=self.rec_model.input_size[0]))
+                    targets.append(track)
+                else:
+                    self.tracked_faces += 1
+            frame_tracks.append(tracks)
+
+        similarities = [None] * len(crops)
+        try:
+            if crops and len(self.gallery):
+                embeddings = self.rec_model.get_feat(crops)
+                similarities = self.gallery.best_similarities(embeddings)
+                self.recognized_faces += len(crops)
+                if self.embedding_store is not None:
+                    for track, index in zip(targets, self.embedding_store.add_embeddings(embeddings)):
+                        track.embedding_index = index
+        finally:
+            for track, similarity in zip(targets, similarities):
+                track.similarity = None if similarity is None else float(similarity)
+                track.pending = False
+
+        results: List[Optional[float]] = []
+        for i, tracks in enumerate(frame_tracks):
+            known = [track.similarity for track in tracks if track.similarity is not None]
+            results.append(max(known) if known else None)
+            if self.embedding_store is not None and timestamps is not None:
+                self.embedding_store.add_frame(
+                    timestamps[i],
+                    [track.embedding_index for track in tracks if track.embedding_index is not None]
+                )
+        return results
+
+    def get_face_similarities_safe(
+        self,
+        frames: List[NDArray],
+        timestamps: Optional[List[int]] = None
+    ) -> List[Optional[float]]:
+        """批量计算多帧的人脸相似度，整批出错时逐帧重试，仍然出错的帧相似度为None
+
+        不会因为其中一帧出错丢掉整批帧。
+        """
+        try:
+            return self.get_face_similarities(frames, timestamps)
+        except Exception as e:
+            print(f"Error processing a batch of {len(frames)} frames, retrying frame by frame:")
+            traceback.print_exc()
+
+        # 出错的批次可能已经更新了一部分跟踪和镜头状态，重试时重新开始跟踪，
+        # 重试的帧会再次经过镜头检测，本视频的镜头索引不再完整，不会保存
+        self.tracker.reset()
+        self.shot_detector.complete = False
+        results: List[Optional[float]] = []
+        for i, frame in enumerate(frames):
+            try:
+                results.append(self.get_face_similarities(
+                    [frame], None if timestamps is None else [timestamps[i]]
+                )[0])
+            except Exception as e:
+                traceback.print_exc()
+                results.append(None)
+                # 该帧没有记录人脸特征，特征文件不完整，不会保存
+                if self.embedding_store is not None:
+                    self.embedding_store.complete = False
+        return results
+
+    def save_embeddings(self, video_title: str, embeddings_folder: str = EMBEDDINGS_OUTPUT) -> None:
+        """保存当前视频的逐帧人脸特征"""
+        if self.embedding_store is None:
+            return
+        path = embeddings_path(video_title, embeddings_folder)
+        if not self.embedding_store.complete:
+            print(f"Skip saving face embeddings for {video_title}: some frames are missing (resumed without a saved sidecar or failed frames)")
+            return
+        self.embedding_store.save(path)
+        print(f"Face embeddings saved to {path}")
+
+    def save_shot_index(self, video_title: str, output_folder: str = SUBTITLE_OUTPUT) -> None:
+        """保存当前视频的镜头切换索引"""
+        self.shot_detector.save(video_title, output_folder)
 
     def get_face_similarity(self, frame: NDArray) -> Optional[float]:
         """计算人脸相似度"""
-        face_encodings = self.extract_face_encodings(frame)
-        if not face_encodings or len(self.known_face_encodings) == 0:
-            return None
-
-        if self.use_cuda:
-            import torch
-            face_encodings_tensor = torch.tensor(
-                np.vstack(face_encodings), 
-                device='cuda'
-            ).float()
-
-            similarities = torch.nn.functional.cosine_similarity(
-                self.known_face_encodings.unsqueeze(1),
-                face_encodings_tensor.unsqueeze(0),
-                dim=2
-            )
-            return float(similarities.max().cpu().item())
-        else:
+        return self.get_face_similarities([frame])[0]
 
-            similarities = cosine_similarity(
-                self.known_face_encodings,
-                np.vstack(face_encodings)
-            )
-            return float(np.max(similarities))
+    @staticmethod
+    def format_timestamp(frame_count: int, frame_rate: float) -> str:
+        """将帧序号转换为 "2m28s" 格式的时间戳"""
+        minutes, seconds = divmod(int(frame_count / frame_rate), 60)
+        return f"{minutes}m{seconds:02d}s"
 
-    def process_video(self, video_path: str, fps: int = 1, save_frames_folder: str = "output_frames", start_time: Optional[int] = None) -> None:
+    def iter_sampled_frames(
+        self,
+        video_path: str,
+        fps: int = 1,
+        start_time: Optional[int] = None
+    ) -> Iterator[Tuple[int, float, NDArray]]:
+        """按采样间隔解码视频，逐个产出 (帧序号, 帧率, RGB帧)"""
         if not os.path.exists(video_path):
             raise FileNotFoundError(f"Video file not found: {video_path}")
 
-        os.makedirs(save_frames_folder, exist_ok=True)
+        # 新视频重新开始跟踪和统计
+        self.tracker.reset()
+        self.frames_since_detect = 0
+        self.recognized_faces = 0
+        self.tracked_faces = 0
         video_title = os.path.splitext(os.path.basename(video_path))[0]
+        if self.embedding_store is not None:
+            # 断点续传时接着之前保存的记录追加，避免只用后半段覆盖整个视频的特征文件
+            if start_time:
+                self.embedding_store.resume(embeddings_path(video_title), start_time)
+            else:
+                self.embedding_store.reset()
+        self.shot_detector.start(video_title, from_beginning=not start_time)
 
-        cap = cv2.VideoCapture(video_path)
-        try:
-            if not cap.isOpened():
-                raise RuntimeError("Error: Cannot open video file.")
+        decoder = create_decoder(video_path)
+        yield from decoder.iter_frames(fps, start_time)
+        decoder.report()
+        if self.tracker.enabled:
+            print(f"Faces recognized: {self.recognized_faces}, reused from tracks: {self.tracked_faces}")
 
-            frame_rate = cap.get(cv2.CAP_PROP_FPS)
-            interval = max(1, int(frame_rate / fps))
-            frame_count = 0
-            
-            # 如果有起始时间，先定位到对应位置
-            if start_time is not None:
-                frame_count = int(start_time * frame_rate)
-                cap.set(cv2.CAP_PROP_POS_FRAMES, frame_count)
-
-            while True:
-                ret, frame = cap.read()
-                if not ret:
-                    break
+    def process_video(
+        self,
+        video_path: str,
+        fps: int = 1,
+        save_frames_folder: str = "output_frames",
+        start_time: Optional[int] = None,
+        on_progress: Optional[Callable[[int], None]] = None
+    ) -> bool:
+        """识别视频中的人脸并保存采样帧，每处理完一批帧调用on_progress(最后一帧的秒数)，返回是否成功"""
+        if not os.path.exists(video_path):
+            raise FileNotFoundError(f"Video file not found: {video_path}")
 
-                try:
-                    if frame_count % interval == 0:
-                        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                        self._process_frame(
-                            frame_rgb, frame_count, frame_rate, 
-                            video_title, save_frames_folder
-                        )
-                except Exception as e:
-                    print(f"Error processing frame {frame_count}:")
-                    traceback.print_exc()
+        os.makedirs(save_frames_folder, exist_ok=True)
+        video_title = os.path.splitext(os.path.basename(video_path))[0]
 
-                frame_count += 1
+        try:
+            batch = []
+            for item in self.iter_sampled_frames(video_path, fps, start_time):
+                batch.append(item)
+                if len(batch) >= FACE_BATCH_SIZE:
+                    self._process_batch(batch, video_title, save_frames_folder, on_progress)
+                    batch = []
+            self._process_batch(batch, video_title, save_frames_folder, on_progress)
+            self.save_embeddings(video_title)
+            self.save_shot_index(video_title)
 
         except Exception as e:
             print("Error processing video:")
             traceback.print_exc()
-        finally:
-            cap.release()
+            return False
 
         print(f"Processing completed. Frames saved to {save_frames_folder}")
+        return True
 
-    def _process_frame(
+    def _process_batch(
+        self,
+        batch: List[Tuple[int, float, NDArray]],
+        video_title: str,
+        save_frames_folder: str,
+        on_progress: Optional[Callable[[int], None]] = None
+    ) -> None:
+        if not batch:
+            return
+        similarities = self.get_face_similarities_safe(
+            [frame for _, _, frame in batch],
+            [int(frame_count / frame_rate) for frame_count, frame_rate, _ in batch]
+        )
+
+        for (frame_count, frame_rate, frame), similarity in zip(batch, similarities):
+            try:
+                self._save_frame(
+                    frame, frame_count, frame_rate, similarity or 0.0,
+                    video_title, save_frames_folder
+                )
+            except Exception as e:
+                print(f"Error processing frame {frame_count}:")
+                traceback.print_exc()
+
+        # 本批帧已写入文件夹后再记录进度
+        if on_progress is not None:
+            frame_count, frame_rate, _ = batch[-1]
+            on_progress(int(frame_count / frame_rate))
+
+    def _save_frame(
         self, 
         frame: NDArray, 
         frame_count: int, 
         frame_rate: float,
+        similarity: float,
         video_title: str,
         save_frames_folder: str
     ) -> None:
-        time_sec = frame_count / frame_rate
-        minutes, seconds = divmod(int(time_sec), 60)
-        
-        similarity = self.get_face_similarity(frame) or 0.0
+        timestamp = self.format_timestamp(frame_count, frame_rate)
         
         frame_filename = os.path.join(
             save_frames_folder,
-            f"{video_title}_{minutes}m{seconds:02d}s_sim_{similarity:.3f}.jpg"
+            f"{video_title}_{timestamp}_sim_{similarity:.3f}.jpg"
         )
         
         # Convert numpy array to PIL Image and save
         Image.fromarray(frame).save(frame_filename)
-        print(f"Frame {frame_count}: {minutes}m{seconds:02d}s - similarity = {similarity:.3f}")
+        print(f"Frame {frame_count}: {timestamp} - similarity = {similarity:.3f}")
 
-    def process_video_with_params(self, video_path: str, output_folder: str, fps: int = 1, start_time: Optional[int] = None) -> None:
-        self.process_video(video_path, fps, output_folder, start_time)
\ No newline at end of file
+    def process_video_with_params(
+        self,
+        video_path: str,
+        output_folder: str,
+        fps: int = 1,
+        start_time: Optional[int] = None,
+        on_progress: Optional[Callable[[int], None]] = None
+    ) -> bool:
+        return self.process_video(video_path, fps, output_folder, start_time, on_progress)
\ No newline at end of file
@@ -0,0 +1,145 @@
+import os
+import json
+import argparse
+import numpy as np
+from typing import Dict, List
+from numpy.typing import NDArray
+from face_gallery import FaceGallery, normalize_rows
+from subtitle_writer import atomic_write_json, parse_timestamp
+from params import EMBEDDINGS_OUTPUT, SUBTITLE_OUTPUT, FEATURES_FILE
+
+
+class FaceEmbeddingStore:
+    """记录单个视频每个采样帧上的人脸特征，保存为与字幕同名的NPZ文件
+
+    文件内容：
+        timestamps: (M,) 每个采样帧的秒数
+        face_frame: (K,) 每张人脸所在的采样帧序号
+        face_embedding: (K,) 每张人脸对应的特征行号
+        embeddings: (E, D) L2归一化后的float16特征
+    跟踪得到的同一条轨迹在多帧间共用一行特征。
+    """
+
+    def __init__(self) -> None:
+        self.reset()
+
+    def reset(self) -> None:
+        self.timestamps: List[int] = []
+        self.face_frame: List[int] = []
+        self.face_embedding: List[int] = []
+        self.embeddings: List[NDArray] = []
+        self.count = 0
+        self.complete = True  # 是否记录了视频的每个采样帧，只有完整的记录才会保存
+
+    def resume(self, path: str, start_time: int) -> None:
+        """从start_time秒继续处理视频时，载入之前保存的start_time之前的记录以便接着追加
+
+        没有之前保存的文件时本次记录不完整，不会覆盖保存。
+        """
+        self.reset()
+        if not os.path.exists(path):
+            self.complete = False
+            return
+        data = np.load(path)
+        kept_frames = np.flatnonzero(data['timestamps'] < start_time)
+        kept_faces = np.isin(data['face_frame'], kept_frames)
+        # 只保留仍被引用的特征行，并重新编号
+        used, face_embedding = np.unique(data['face_embedding'][kept_faces], return_inverse=True)
+        frame_map = np.full(len(data['timestamps']), -1, dtype=np.int64)
+        frame_map[kept_frames] = np.arange(len(kept_frames))
+
+        self.timestamps = data['timestamps'][kept_frames].tolist()
+        self.face_frame = frame_map[data['face_frame'][kept_faces]].tolist()
+        self.face_embedding = face_embedding.tolist()
+        if len(used):
+            self.embeddings = [data['embeddings'][used]]
+        self.count = len(used)
+
+    def add_embeddings(self, embeddings: NDArray) -> List[int]:
+        """追加一批特征，返回它们的行号"""
+        start = self.count
+        self.embeddings.append(normalize_rows(embeddings).astype(np.float16))
+        self.count += len(embeddings)
+        return list(range(start, self.count))
+
+    def add_frame(self, timestamp: int, embedding_indices: List[int]) -> None:
+        """记录一个采样帧及其上各人脸的特征行号"""
+        frame = len(self.timestamps)
+        self.timestamps.append(timestamp)
+        for index in embedding_indices:
+            self.face_frame.append(frame)
+            self.face_embedding.append(index)
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        embeddings = np.vstack(self.embeddings) if self.embeddings else np.zeros((0, 0), dtype=np.float16)
+        np.savez_compressed(
+            path,
+            timestamps=np.array(self.timestamps, dtype=np.int32),
+            face_frame=np.array(self.face_frame, dtype=np.int32),
+            face_embedding=np.array(self.face_embedding, dtype=np.int32),
+            embeddings=embeddings
+        )
+
+
+def embeddings_path(video_title: str, embeddings_folder: str = EMBEDDINGS_OUTPUT) -> str:
+    return os.path.join(embeddings_folder, f"{video_title}.npz")
+
+
+def frame_similarities(path: str, gallery: FaceGallery) -> Dict[int, float]:
+    """用新的特征库重新计算每秒的最大人脸相似度，没有人脸的帧为0"""
+    data = np.load(path)
+    timestamps = data['timestamps']
+    result = {int(t): 0.0 for t in timestamps}
+    if len(data['face_frame']) == 0 or len(gallery) == 0:
+        return result
+
+    scores = gallery.best_similarities(data['embeddings'].astype(np.float32))
+    face_scores = scores[data['face_embedding']]
+    for frame, score in zip(data['face_frame'], face_scores):
+        second = int(timestamps[frame])
+        result[second] = max(result[second], float(score))
+    return result
+
+
+def rescore_subtitles(
+    subtitle_folder: str = SUBTITLE_OUTPUT,
+    embeddings_folder: str = EMBEDDINGS_OUTPUT,
+    features_file: str = FEATURES_FILE
+) -> None:
+    """根据保存的人脸特征和新的特征库更新字幕JSON中的similarity字段，无需重新解码视频"""
+    gallery = FaceGallery.load(features_file)
+    print(f"Loaded {len(gallery)} face features from {features_file}")
+
+    for filename in sorted(os.listdir(subtitle_folder)):
+        if not filename.endswith('.json'):
+            continue
+        video_title = os.path.splitext(filename)[0]
+        sidecar = embeddings_path(video_title, embeddings_folder)
+        if not os.path.exists(sidecar):
+            print(f"Skip {video_title}: no saved embeddings")
+            continue
+
+        similarities = frame_similarities(sidecar, gallery)
+        json_path = os.path.join(subtitle_folder, filename)
+        with open(json_path, 'r', encoding='utf-8') as f:
+            subtitles = json.load(f)
+
+        updated = 0
+        for subtitle in subtitles:
+            second = parse_timestamp(subtitle["timestamp"])
+            if second in similarities:
+                subtitle["similarity"] = round(similarities[second], 3)
+                updated += 1
+
+        atomic_write_json(json_path, subtitles)
+        print(f"Rescored {updated}/{len(subtitles)} subtitles in {video_title}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="使用新的人脸特征库重新计算字幕的相似度")
+    parser.add_argument("--subtitles", default=SUBTITLE_OUTPUT, help="字幕JSON文件夹")
+    parser.add_argument("--embeddings", default=EMBEDDINGS_OUTPUT, help="人脸特征文件夹")
+    parser.add_argument("--features", default=FEATURES_FILE, help="人脸特征库文件")
+    args = parser.parse_args()
+    rescore_subtitles(args.subtitles, args.embeddings, args.features)
@@ -0,0 +1,203 @@
+import argparse
+import numpy as np
+from typing import List, Optional, Tuple
+from numpy.typing import NDArray
+from params import FEATURES_FILE, USE_FAISS_GALLERY, FAISS_GALLERY_MIN_SIZE, GALLERY_DEDUP_THRESHOLD
+
+
+def normalize_rows(vectors: NDArray) -> NDArray:
+    """按行L2归一化，返回连续的float32矩阵"""
+    matrix = np.ascontiguousarray(vectors, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return np.ascontiguousarray(matrix / norms)
+
+
+def prune_near_duplicates(matrix: NDArray, threshold: float, block_size: int = 1024) -> List[int]:
+    """贪心去除近似重复的特征，返回保留的行号
+
+    与已保留的任一特征余弦相似度不低于threshold的特征会被丢弃。
+    按块处理：每块先用一次矩阵乘法与之前各块保留的特征比较，再在块内按顺序贪心筛选。
+    """
+    keep: List[int] = []
+    # 已保留的特征依次写入预先分配的矩阵，不必每次重新拼接
+    kept = np.empty_like(matrix)
+    for start in range(0, len(matrix), block_size):
+        block = matrix[start:start + block_size]
+        candidates = np.arange(len(block))
+        if keep:
+            similar = (block @ kept[:len(keep)].T).max(axis=1) >= threshold
+            candidates = candidates[~similar]
+        if len(candidates) == 0:
+            continue
+
+        # 块内的候选之间两两比较，只与本块中已保留的候选比较
+        similarities = block[candidates] @ block[candidates].T
+        local: List[int] = []
+        for j in range(len(candidates)):
+            if local and similarities[j, local].max() >= threshold:
+                continue
+            local.append(j)
+        for j in local:
+            kept[len(keep)] = block[candidates[j]]
+            keep.append(start + int(candidates[j]))
+    return keep
+
+
+def kmeans_prototypes(matrix: NDArray, k: int, iterations: int = 30, seed: int = 0) -> Tuple[NDArray, NDArray]:
+    """球面k-means聚类，返回 (归一化的聚类中心, 每个特征所属的类别)"""
+    k = min(k, len(matrix))
+    rng = np.random.default_rng(seed)
+    centers = matrix[rng.choice(len(matrix), k, replace=False)].copy()
+    assign = np.zeros(len(matrix), dtype=np.int64)
+    for _ in range(iterations):
+        new_assign = np.argmax(matrix @ centers.T, axis=1)
+        for j in range(k):
+            members = matrix[new_assign == j]
+            if len(members):
+                centers[j] = members.sum(axis=0)
+        centers = normalize_rows(centers)
+        if np.array_equal(new_assign, assign):
+            break
+        assign = new_assign
+    return centers, assign
+
+
+def select_medoids(matrix: NDArray, n: int, seed: int = 0) -> List[int]:
+    """聚成n类后取每类中最接近中心的真实特征，按类别大小从大到小返回其行号"""
+    centers, assign = kmeans_prototypes(matrix, n, seed=seed)
+    medoids = []
+    for j in np.argsort(-np.bincount(assign, minlength=len(centers))):
+        members = np.flatnonzero(assign == j)
+        if len(members):
+            medoids.append(int(members[np.argmax(matrix[members] @ centers[j])]))
+    return medoids
+
+
+class FaceGallery:
+    """已知人脸特征库
+
+    加载时一次性归一化为连续的float32矩阵，匹配只需一次矩阵乘法。
+    特征数量较多且启用FAISS时改用内积索引检索。
+    """
+
+    def __init__(
+        self,
+        encodings: NDArray,
+        use_faiss: bool = USE_FAISS_GALLERY,
+        faiss_min_size: int = FAISS_GALLERY_MIN_SIZE,
+        device: Optional[str] = None,
+        dedup_threshold: float = GALLERY_DEDUP_THRESHOLD
+    ) -> None:
+        self.matrix = normalize_rows(encodings) if len(encodings) else np.zeros((0, 0), dtype=np.float32)
+        if dedup_threshold and len(self.matrix):
+            # 加载时去除近似重复的参考特征，匹配开销随特征数量线性下降
+            self.matrix = np.ascontiguousarray(self.matrix[prune_near_duplicates(self.matrix, dedup_threshold)])
+        self.index = None
+        self.tensor = None
+
+        if device == "cuda":
+            import torch
+            self.tensor = torch.tensor(self.matrix, device="cuda")
+        elif use_faiss and len(self.matrix) >= faiss_min_size:
+            import faiss
+            self.index = faiss.IndexFlatIP(self.matrix.shape[1])
+            self.index.add(self.matrix)
+
+    @classmethod
+    def load(cls, features_file: str, **kwargs) -> "FaceGallery":
+        """从NPZ文件加载特征库"""
+        data = np.load(features_file)
+        return cls(data['encodings'], **kwargs)
+
+    def __len__(self) -> int:
+        return len(self.matrix)
+
+    def best_similarities(self, queries: NDArray) -> NDArray:
+        """返回每个查询向量与特征库的最大余弦相似度"""
+        queries = normalize_rows(queries)
+        if self.tensor is not None:
+            import torch
+            query_tensor = torch.from_numpy(queries).to("cuda")
+            return (query_tensor @ self.tensor.T).max(dim=1).values.cpu().numpy()
+        if self.index is not None:
+            distances, _ = self.index.search(queries, 1)
+            return distances[:, 0]
+        return (queries @ self.matrix.T).max(axis=1)
+
+    def max_similarity(self, queries: NDArray) -> Optional[float]:
+        """所有查询向量中的最大相似度，特征库或查询为空时返回None"""
+        if len(self) == 0 or len(queries) == 0:
+            return None
+        return float(np.max(self.best_similarities(np.vstack(queries))))
+
+
+def evaluate(gallery: FaceGallery, embeddings: NDArray, labels: NDArray, thresholds: List[float]) -> List[Tuple[float, float, float]]:
+    """在带标签的样本上计算各阈值下的 (阈值, 召回率, 精确率)"""
+    scores = gallery.best_similarities(embeddings)
+    labels = labels.astype(bool)
+    results = []
+    for threshold in thresholds:
+        predicted = scores >= threshold
+        true_positive = np.count_nonzero(predicted & labels)
+        recall = true_positive / max(1, np.count_nonzero(labels))
+        precision = true_positive / max(1, np.count_nonzero(predicted))
+        results.append((threshold, recall, precision))
+    return results
+
+
+def compact_gallery(
+    features_file: str,
+    output_file: str,
+    dedup_threshold: float = 0.0,
+    prototypes: int = 0,
+    medoids: int = 0,
+    eval_file: Optional[str] = None,
+    thresholds: Tuple[float, ...] = (0.4, 0.5, 0.6, 0.7)
+) -> None:
+    """压缩人脸特征库：去除近似重复特征，可选替换为k-means原型或保留前N个medoid"""
+    data = np.load(features_file)
+    matrix = normalize_rows(data['encodings'])
+    image_paths = data['image_paths'] if 'image_paths' in data else np.array([''] * len(matrix))
+    print(f"Loaded {len(matrix)} face features from {features_file}")
+
+    keep = list(range(len(matrix)))
+    if dedup_threshold:
+        keep = prune_near_duplicates(matrix, dedup_threshold)
+        print(f"Near-duplicate pruning (>= {dedup_threshold}): {len(matrix)} -> {len(keep)}")
+    compacted, compacted_paths = matrix[keep], image_paths[keep]
+
+    if prototypes:
+        compacted, _ = kmeans_prototypes(compacted, prototypes)
+        compacted_paths = np.array([f"prototype_{j}" for j in range(len(compacted))])
+        print(f"K-means prototypes: {len(keep)} -> {len(compacted)}")
+    elif medoids:
+        selected = select_medoids(compacted, medoids)
+        compacted, compacted_paths = compacted[selected], compacted_paths[selected]
+        print(f"Medoids: {len(keep)} -> {len(compacted)}")
+
+    np.savez(output_file, encodings=compacted, image_paths=compacted_paths)
+    print(f"Compacted gallery ({len(compacted)} features) saved to {output_file}")
+
+    if eval_file:
+        sample = np.load(eval_file)
+        before = evaluate(FaceGallery(matrix, use_faiss=False, dedup_threshold=0), sample['embeddings'], sample['labels'], list(thresholds))
+        after = evaluate(FaceGallery(compacted, use_faiss=False, dedup_threshold=0), sample['embeddings'], sample['labels'], list(thresholds))
+        print(f"\nEvaluated on {len(sample['labels'])} labelled faces ({len(matrix)} -> {len(compacted)} features)")
+        print("threshold  recall(before/after)  precision(before/after)")
+        for (threshold, r0, p0), (_, r1, p1) in zip(before, after):
+            print(f"{threshold:>9.2f}  {r0:>8.3f} / {r1:<8.3f}   {p0:>8.3f} / {p1:<8.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="压缩人脸特征库")
+    parser.add_argument("--features", default=FEATURES_FILE, help="原始人脸特征库文件")
+    parser.add_argument("--output", default="face_features_compact.npz", help="压缩后的特征库文件")
+    parser.add_argument("--dedup", type=float, default=0.95, help="近似重复的余弦相似度阈值，0表示不去重")
+    parser.add_argument("--prototypes", type=int, default=0, help="替换为指定数量的k-means原型")
+    parser.add_argument("--medoids", type=int, default=0, help="只保留指定数量的medoid")
+    parser.add_argument("--eval", help="带标签的样本NPZ文件，包含embeddings和labels(1为目标人物)")
+    args = parser.parse_args()
+    compact_gallery(args.features, args.output, args.dedup, args.prototypes, args.medoids, args.eval)
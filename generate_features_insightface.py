@@ -1,11 +1,15 @@
 import cv2
 import numpy as np
 import os
+import io
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
 from insightface.app import FaceAnalysis
 from PIL import Image
 import traceback
-from params import FACE_IMAGES_FOLDER, FEATURES_FILE, USE_GPU_FACE
+from params import FACE_IMAGES_FOLDER, FEATURES_FILE, USE_GPU_FACE, FEATURE_WORKERS
 
 class FeatureGenerator:
     def __init__(self):
@@ -33,39 +37,98 @@ class FeatureGenerator:
             
         return faces[0].embedding
 
-    def generate_features(self):
-        face_encodings = []
-        
+    def hash_image(self, image_path):
+        """计算图片文件内容的哈希，用于增量更新"""
+        with open(image_path, 'rb') as f:
+            return hashlib.sha1(f.read()).hexdigest()
+
+    def embed_image(self, image_path):
+        """读取图片并提取人脸特征，失败时返回None"""
+        try:
+            with open(image_path, 'rb') as f:
+                data = f.read()
+            # 使用PIL读取图片
+            pil_img = Image.open(io.BytesIO(data))
+            # 转换为RGB模式（如果是RGBA或其他模式）
+            if pil_img.mode != 'RGB':
+                pil_img = pil_img.convert('RGB')
+            # 转换为OpenCV格式
+            img = cv2.cvtColor(np.array(pil_img), cv2.COLOR_RGB2BGR)
+
+            return self.extract_face_encoding(img)
+        except Exception as e:
+            print(f"Error processing {os.path.basename(image_path)}:")
+            traceback.print_exc()
+            return None
+
+    def load_existing(self):
+        """读取已有特征文件中按内容哈希索引的特征，旧格式文件没有哈希时返回空"""
+        if not os.path.exists(FEATURES_FILE):
+            return {}, set()
+        data = np.load(FEATURES_FILE)
+        if 'hashes' not in data:
+            print(f"{FEATURES_FILE} has no content hashes, rebuilding from scratch")
+            return {}, set()
+        existing = {
+            str(digest): encoding
+            for digest, encoding in zip(data['hashes'], data['encodings'])
+        }
+        no_face = set(str(digest) for digest in data['no_face_hashes']) if 'no_face_hashes' in data else set()
+        return existing, no_face
+
+    def generate_features(self, incremental=True, workers=FEATURE_WORKERS):
         # 获取所有图片文件
-        image_files = [f for f in os.listdir(FACE_IMAGES_FOLDER) 
-                      if f.lower().endswith(('.jpg', '.jpeg', '.png'))]
-        
-        print(f"Processing {len(image_files)} images...")
-        
-        # 使用tqdm显示进度条
-        for image_file in tqdm(image_files):
-            image_path = os.path.join(FACE_IMAGES_FOLDER, image_file)
-            try:
-                # 使用PIL读取图片
-                pil_img = Image.open(image_path)
-                # 转换为RGB模式（如果是RGBA或其他模式）
-                if pil_img.mode != 'RGB':
-                    pil_img = pil_img.convert('RGB')
-                # 转换为OpenCV格式
-                img = cv2.cvtColor(np.array(pil_img), cv2.COLOR_RGB2BGR)
-                
-                face_encoding = self.extract_face_encoding(img)
-                if face_encoding is not None:
-                    face_encodings.append(face_encoding)
-            except Exception as e:
-                print(f"Error processing {image_file}:")
-                traceback.print_exc()
-                
+        image_files = sorted(f for f in os.listdir(FACE_IMAGES_FOLDER)
+                             if f.lower().endswith(('.jpg', '.jpeg', '.png')))
+        image_paths = [os.path.join(FACE_IMAGES_FOLDER, f) for f in image_files]
+
+        existing, no_face = self.load_existing() if incremental else ({}, set())
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            hashes = list(tqdm(executor.map(self.hash_image, image_paths), total=len(image_paths), desc="Hashing"))
+
+            # 只处理新增或内容有变化的图片
+            todo = [
+                i for i, digest in enumerate(hashes)
+                if digest not in existing and digest not in no_face
+            ]
+            print(f"Processing {len(todo)} new or changed images ({len(image_paths) - len(todo)} unchanged)...")
+
+            # 使用tqdm显示进度条，解码和特征提取在线程池中并行执行
+            new_encodings = list(tqdm(
+                executor.map(self.embed_image, [image_paths[i] for i in todo]),
+                total=len(todo),
+                desc="Embedding"
+            ))
+
+        for i, encoding in zip(todo, new_encodings):
+            if encoding is None:
+                no_face.add(hashes[i])
+            else:
+                existing[hashes[i]] = encoding
+
+        # 按当前文件夹中的图片重新组装，已删除的图片不再保留
+        face_encodings = []
+        valid_image_paths = []
+        valid_hashes = []
+        seen = set()
+        for image_path, digest in zip(image_paths, hashes):
+            # 内容完全相同的图片只保留一份特征
+            if digest in existing and digest not in seen:
+                face_encodings.append(existing[digest])
+                valid_image_paths.append(image_path)
+                valid_hashes.append(digest)
+                seen.add(digest)
+        current_no_face = sorted(set(hashes) & no_face)
+
         try:
-            # 保存特征向量
+            # 保存特征向量及其来源图片
             if face_encodings:
                 np.savez(FEATURES_FILE,
-                        encodings=np.array(face_encodings))
+                        encodings=np.array(face_encodings),
+                        image_paths=np.array(valid_image_paths),
+                        hashes=np.array(valid_hashes),
+                        no_face_hashes=np.array(current_no_face, dtype=str))
                 print(f"\nSuccessfully generated features for {len(face_encodings)} images")
                 print(f"Features saved to {FEATURES_FILE}")
             else:
@@ -75,5 +138,10 @@ class FeatureGenerator:
             traceback.print_exc()
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="生成人脸特征库")
+    parser.add_argument("--full", action="store_true", help="忽略已有特征文件，全部重新生成")
+    parser.add_argument("--workers", type=int, default=FEATURE_WORKERS, help="并行处理的线程数")
+    args = parser.parse_args()
+
     generator = FeatureGenerator()
-    generator.generate_features()
+    generator.generate_features(incremental=not args.full, workers=args.workers)
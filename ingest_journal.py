@@ -0,0 +1,154 @@
+import os
+import time
+import sqlite3
+import argparse
+from typing import Optional, Set
+import cv2
+from params import INGEST_JOURNAL
+
+# 视频处理阶段，按先后顺序排列
+STAGE_FACES = "faces"  # 人脸识别进行中(frames模式下帧已写入FRAMES_OUTPUT)
+STAGE_SUBTITLES = "subtitles"  # 人脸识别已完成，等待OCR
+STAGE_CLEANUP = "cleanup"  # 字幕已保存，等待清理帧文件
+STAGE_DONE = "done"
+
+
+class IngestJournal:
+    """基于SQLite(WAL模式)的处理日志，记录每个视频完成到的阶段和最后处理的时间戳
+
+    每次更新都在独立的事务中提交，进程崩溃后重启只需按视频标题查询一行即可确定续跑位置。
+    """
+
+    def __init__(self, path: str = INGEST_JOURNAL) -> None:
+        self.path = path
+        # 并行处理时多个进程同时写入，等待锁而不是立即报错
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS videos (
+                title TEXT PRIMARY KEY,
+                stage TEXT NOT NULL,
+                last_timestamp INTEGER,
+                duration INTEGER,
+                session_timestamp INTEGER,
+                session_started_at REAL,
+                updated_at REAL,
+                finished_at REAL,
+                error TEXT
+            )
+        """)
+        self.conn.commit()
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def get(self, title: str) -> Optional[sqlite3.Row]:
+        return self.conn.execute("SELECT * FROM videos WHERE title = ?", (title,)).fetchone()
+
+    def stage(self, title: str) -> Optional[str]:
+        row = self.get(title)
+        return row["stage"] if row else None
+
+    def resume_time(self, title: str) -> Optional[int]:
+        """人脸识别阶段的续跑位置（秒），从未处理过时返回None"""
+        row = self.get(title)
+        if row is None or row["stage"] != STAGE_FACES or row["last_timestamp"] is None:
+            return None
+        return row["last_timestamp"] + 1
+
+    def completed(self) -> Set[str]:
+        return {row[0] for row in self.conn.execute("SELECT title FROM videos WHERE stage = ?", (STAGE_DONE,))}
+
+    def start(self, title: str, video_path: str, resume: bool = True) -> None:
+        """开始(或继续)处理一个视频，记录视频时长和本次开始的位置
+
+        resume为False时视频从头重新处理，清除之前记录的进度。
+        """
+        duration = None
+        cap = cv2.VideoCapture(video_path)
+        if cap.isOpened():
+            frame_rate = cap.get(cv2.CAP_PROP_FPS)
+            if frame_rate > 0:
+                duration = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) / frame_rate)
+        cap.release()
+
+        now = time.time()
+        with self.conn:
+            self.conn.execute("""
+                INSERT INTO videos (title, stage, duration, session_timestamp, session_started_at, updated_at)
+                VALUES (?, ?, ?, NULL, ?, ?)
+                ON CONFLICT(title) DO UPDATE SET
+                    duration = excluded.duration,
+                    last_timestamp = CASE WHEN ? THEN videos.last_timestamp END,
+                    session_timestamp = CASE WHEN ? THEN videos.last_timestamp END,
+                    session_started_at = excluded.session_started_at,
+                    updated_at = excluded.updated_at,
+                    error = NULL
+            """, (title, STAGE_FACES, duration, now, now, resume, resume))
+
+    def update_progress(self, title: str, timestamp: int) -> None:
+        """记录已处理完的最后一个时间戳（秒）"""
+        with self.conn:
+            self.conn.execute(
+                "UPDATE videos SET last_timestamp = ?, updated_at = ? WHERE title = ?",
+                (timestamp, time.time(), title)
+            )
+
+    def set_stage(self, title: str, stage: str) -> None:
+        now = time.time()
+        with self.conn:
+            self.conn.execute(
+                "UPDATE videos SET stage = ?, updated_at = ?, finished_at = ? WHERE title = ?",
+                (stage, now, now if stage == STAGE_DONE else None, title)
+            )
+
+    def set_error(self, title: str, error: str) -> None:
+        with self.conn:
+            self.conn.execute(
+                "UPDATE videos SET error = ? WHERE title = ?",
+                (error, title)
+            )
+
+    def report(self) -> None:
+        """输出每个视频的处理阶段、处理速度（视频秒数/实际秒数）和预计剩余时间"""
+        rows = self.conn.execute("SELECT * FROM videos ORDER BY updated_at").fetchall()
+        if not rows:
+            print(f"No videos recorded in {self.path}")
+            return
+
+        print(f"{'stage':<10} {'progress':>17} {'speed':>8} {'ETA':>9}  title")
+        for row in rows:
+            last = row["last_timestamp"] or 0
+            duration = row["duration"]
+            progress = f"{last}/{duration}s" if duration else f"{last}s"
+
+            speed = eta = "-"
+            processed = last - (row["session_timestamp"] or 0)
+            elapsed = (row["updated_at"] or 0) - (row["session_started_at"] or 0)
+            if processed > 0 and elapsed > 0:
+                rate = processed / elapsed
+                speed = f"{rate:.2f}x"
+                if duration and row["stage"] != STAGE_DONE:
+                    eta = f"{max(0, duration - last) / rate / 60:.1f}m"
+
+            print(f"{row['stage']:<10} {progress:>17} {speed:>8} {eta:>9}  {row['title']}")
+            if row["error"]:
+                print(f"{'':<10} last error: {row['error'].strip().splitlines()[-1]}")
+
+        total = len(rows)
+        done = sum(1 for row in rows if row["stage"] == STAGE_DONE)
+        print(f"\n{done}/{total} videos done")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="查看视频处理进度")
+    parser.add_argument("--journal", default=INGEST_JOURNAL, help="处理日志数据库文件")
+    args = parser.parse_args()
+    if not os.path.exists(args.journal):
+        print(f"Journal not found: {args.journal}")
+    else:
+        journal = IngestJournal(args.journal)
+        journal.report()
+        journal.close()
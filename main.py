@@ -1,11 +1,18 @@
 #from FaceRec import FaceRecognizer
 from FaceRec_insightface import FaceRecognizer
-from CutSubtitle_paddleocr import SubtitleExtractor
+from pipeline import StreamingPipeline
+from ocr_pool import load_extractor
+from ingest_journal import IngestJournal, STAGE_FACES, STAGE_SUBTITLES, STAGE_CLEANUP, STAGE_DONE
 import os
+import time
 import traceback
-import re
+import multiprocessing
 from params import *
 
+# 工作进程内常驻的流水线，模型在进程启动时只加载一次
+_worker_pipeline = None
+_worker_journal = None
+
 def clean_frames_folder():
     """清理帧输出文件夹中的所有文件"""
     if os.path.exists(FRAMES_OUTPUT):
@@ -17,25 +24,79 @@ def clean_frames_folder():
             except Exception as e:
                 print(f"Error: {e}")
 
-def get_video_progress(video_title):
-    """获取视频处理进度"""
-    if not os.path.exists(FRAMES_OUTPUT):
-        return None
-        
-    frame_files = [f for f in os.listdir(FRAMES_OUTPUT) 
-                   if f.startswith(video_title + "_")]
-    if not frame_files:
-        return None
-        
-    # 从文件名中提取时间戳
-    timestamps = []
-    for f in frame_files:
-        match = re.match(r'.*_(\d+)m(\d+)s_.*', f)
-        if match:
-            minutes, seconds = map(int, match.groups())
-            timestamps.append(minutes * 60 + seconds)
-    
-    return max(timestamps) if timestamps else None
+def stream_video(pipeline, journal, video_path):
+    """流式处理单个视频，进度和完成状态记录到处理日志
+
+    中断的视频从处理日志记录的位置继续：已识别的字幕保存在字幕文件夹的 <视频名>.jsonl 中，
+    续跑时载入该位置之前的字幕接着追加。没有字幕日志时从头重新处理。
+    """
+    video_title = os.path.splitext(os.path.basename(video_path))[0]
+    start_time = journal.resume_time(video_title)
+    if start_time is not None:
+        writer = pipeline.subtitle_extractor.writer
+        writer.folder = SUBTITLE_OUTPUT
+        kept = writer.resume(video_title, start_time)
+        if kept < 0:
+            print(f"No subtitle log for {video_title}, processing from the beginning")
+            start_time = None
+        else:
+            print(f"Resuming from timestamp: {start_time//60}m{start_time%60}s with {kept} subtitles")
+    journal.start(video_title, video_path, resume=start_time is not None)
+    try:
+        pipeline.process_video(
+            video_path=video_path,
+            output_folder=SUBTITLE_OUTPUT,
+            fps=1,
+            start_time=start_time,
+            on_progress=lambda timestamp: journal.update_progress(video_title, timestamp)
+        )
+    except Exception:
+        journal.set_error(video_title, traceback.format_exc())
+        raise
+    journal.set_stage(video_title, STAGE_DONE)
+
+def _init_ingest_worker(cpu_threads):
+    """工作进程初始化：加载人脸识别和OCR模型，各自最多使用cpu_threads个线程"""
+    global _worker_pipeline, _worker_journal
+    # 进程池的工作进程不能再创建子进程，OCR在进程内完成
+    _worker_pipeline = StreamingPipeline(
+        FaceRecognizer(FEATURES_FILE, cpu_threads=cpu_threads),
+        load_extractor(cpu_threads=cpu_threads),
+        ocr_workers=1
+    )
+    _worker_journal = IngestJournal()
+
+def _ingest_video(video_path):
+    """在工作进程中处理单个视频，返回 (视频标题, 错误信息, 耗时)"""
+    video_title = os.path.splitext(os.path.basename(video_path))[0]
+    start = time.time()
+    try:
+        stream_video(_worker_pipeline, _worker_journal, video_path)
+        return video_title, None, time.time() - start
+    except Exception:
+        return video_title, traceback.format_exc(), time.time() - start
+    finally:
+        # 出错时释放该视频的字幕状态
+        _worker_pipeline.subtitle_extractor.writer.discard(video_title)
+
+def process_videos_parallel(video_files, completed_videos):
+    """使用进程池并行处理多个视频，每个工作进程只加载一次模型"""
+    video_paths = [os.path.join(VIDEOS_FOLDER, f) for f in video_files]
+    workers = min(INGEST_WORKERS, len(video_paths))
+    # 各进程平分CPU核数，否则每个进程的推理库都会按全部核数开线程
+    cpu_threads = INGEST_WORKER_THREADS or max(1, (os.cpu_count() or 1) // workers)
+    print(f"Starting {workers} ingest workers with {cpu_threads} threads each")
+
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Pool(processes=workers, initializer=_init_ingest_worker, initargs=(cpu_threads,)) as pool:
+        results = pool.imap_unordered(_ingest_video, video_paths)
+        for done, (video_title, error, elapsed) in enumerate(results, 1):
+            if error is None:
+                completed_videos.add(video_title)
+                print(f"[{done}/{len(video_paths)}] Finished {video_title} in {elapsed:.1f}s")
+            else:
+                print(f"[{done}/{len(video_paths)}] Error processing {video_title}:")
+                print(error)
 
 def process_videos_in_folder():
     """处理文件夹中的所有视频"""
@@ -43,12 +104,17 @@ def process_videos_in_folder():
     os.makedirs(FRAMES_OUTPUT, exist_ok=True)
     os.makedirs(SUBTITLE_OUTPUT, exist_ok=True)
     
-    # 获取已经生成字幕的视频
-    completed_videos = {
+    journal = IngestJournal()
+
+    # 获取已经完成的视频，处理日志中没有记录的视频以是否已有字幕文件为准
+    completed_videos = journal.completed() | {
         os.path.splitext(f)[0] 
         for f in os.listdir(SUBTITLE_OUTPUT) 
-        if f.endswith('.json')
+        if f.endswith('.json') and journal.stage(os.path.splitext(f)[0]) is None
     }
+
+    # 流式处理时所有视频共用一条流水线，模型只加载一次
+    pipeline = None
     
     while True:
         # 获取所有视频文件
@@ -66,6 +132,10 @@ def process_videos_in_folder():
 
         print(f"Found {len(video_files)} videos to process")
 
+        if INGEST_WORKERS > 1 and PIPELINE_MODE == "streaming":
+            process_videos_parallel(video_files, completed_videos)
+            continue
+
         # 处理每个视频
         for i, video_file in enumerate(video_files, 1):
             video_title = os.path.splitext(video_file)[0]
@@ -73,38 +143,69 @@ def process_videos_in_folder():
             print(f"\nProcessing video {i}/{len(video_files)}: {video_file}")
             
             try:
-                # 检查是否有处理进度
-                progress = get_video_progress(video_title)
-                if progress is not None:
-                    print(f"Resuming from timestamp: {progress//60}m{progress%60}s")
-                
-                # 处理视频
-                face_recognizer = FaceRecognizer(FEATURES_FILE)
-                face_recognizer.process_video_with_params(
-                    video_path=video_path,
-                    output_folder=FRAMES_OUTPUT,
-                    fps=1,
-                    start_time=progress
-                )
-                
-                # 处理字幕
-                subtitle_extractor = SubtitleExtractor()
-                subtitle_extractor.process_frames(
-                    input_folder=FRAMES_OUTPUT,
-                    output_folder=SUBTITLE_OUTPUT
-                )
-                
-                # 添加到已完成列表
-                completed_videos.add(video_title)
+                if PIPELINE_MODE == "streaming":
+                    # 帧在内存中依次经过人脸识别和OCR，不再写入帧文件夹
+                    if pipeline is None:
+                        # OCR交给工作进程时主进程不需要OCR模型
+                        pipeline = StreamingPipeline(
+                            FaceRecognizer(FEATURES_FILE),
+                            load_extractor(recognize=OCR_WORKERS <= 1)
+                        )
+                    try:
+                        stream_video(pipeline, journal, video_path)
+                    finally:
+                        # 出错时释放该视频的字幕状态
+                        pipeline.subtitle_extractor.writer.discard(video_title)
+                    completed_videos.add(video_title)
+                    continue
+
+                # 从处理日志中读取已完成的阶段
+                stage = journal.stage(video_title)
+                if stage in (None, STAGE_FACES):
+                    progress = journal.resume_time(video_title)
+                    if progress is not None:
+                        print(f"Resuming from timestamp: {progress//60}m{progress%60}s")
+                    journal.start(video_title, video_path)
+
+                    # 处理视频
+                    face_recognizer = FaceRecognizer(FEATURES_FILE)
+                    if not face_recognizer.process_video_with_params(
+                        video_path=video_path,
+                        output_folder=FRAMES_OUTPUT,
+                        fps=1,
+                        start_time=progress,
+                        on_progress=lambda timestamp: journal.update_progress(video_title, timestamp)
+                    ):
+                        raise RuntimeError(f"Face recognition failed for {video_file}")
+                    journal.set_stage(video_title, STAGE_SUBTITLES)
+                    stage = STAGE_SUBTITLES
+
+                if stage == STAGE_SUBTITLES:
+                    # 处理字幕
+                    subtitle_extractor = load_extractor()
+                    subtitle_extractor.calibrate(video_path)
+                    subtitle_extractor.process_frames(
+                        input_folder=FRAMES_OUTPUT,
+                        output_folder=SUBTITLE_OUTPUT
+                    )
+                    journal.set_stage(video_title, STAGE_CLEANUP)
                 
                 # 清理帧文件
                 clean_frames_folder()
                 print(f"Cleaned frames for {video_file}")
 
+                # 添加到已完成列表
+                journal.set_stage(video_title, STAGE_DONE)
+                completed_videos.add(video_title)
+
             except Exception:
                 print(f"Error processing {video_file}")
                 traceback.print_exc()
+                journal.set_error(video_title, traceback.format_exc())
                 continue
 
+    if pipeline is not None:
+        pipeline.close()
+
 if __name__ == "__main__":
     process_videos_in_folder()
\ No newline at end of file
@@ -0,0 +1,137 @@
+import time
+import hashlib
+import sqlite3
+from typing import Optional, Tuple
+import cv2
+import numpy as np
+from numpy.typing import NDArray
+from params import OCR_CACHE, OCR_CACHE_FILE, OCR_CACHE_SIZE
+
+# 计算哈希前将文字区域缩放到的高度，宽度按比例缩放，不同长度的字幕因此得到不同的哈希
+HASH_HEIGHT = 16
+# 命中的条目攒够这么多个再一起刷新使用时间
+TOUCH_BATCH = 256
+
+
+def band_hash(mask: NDArray) -> bytes:
+    """二值化字幕区域的感知哈希
+
+    先裁剪到文字像素的外接矩形以消除位置偏移，再缩小为低分辨率的二值图，
+    像素级的抖动不会改变结果，而不同的字幕几乎不会得到相同的缩略图。
+    """
+    rows = np.flatnonzero(mask.any(axis=1))
+    cols = np.flatnonzero(mask.any(axis=0))
+    if len(rows) == 0:
+        return hashlib.blake2b(b"", digest_size=16).digest()
+    text = mask[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1].astype(np.uint8) * 255
+    width = max(1, int(round(text.shape[1] * HASH_HEIGHT / text.shape[0])))
+    small = cv2.resize(text, (width, HASH_HEIGHT), interpolation=cv2.INTER_AREA) >= 128
+    return hashlib.blake2b(np.packbits(small).tobytes() + width.to_bytes(4, "little"), digest_size=16).digest()
+
+
+class OCRCache:
+    """持久化的OCR结果缓存，按字幕区域的感知哈希索引，超过容量时淘汰最久未使用的条目
+
+    保存在SQLite数据库中，跨运行、跨进程共享。不同识别引擎的结果互不混用。
+    """
+
+    def __init__(
+        self,
+        engine: str,
+        path: str = OCR_CACHE_FILE,
+        max_entries: int = OCR_CACHE_SIZE,
+        enabled: bool = OCR_CACHE
+    ) -> None:
+        self.engine = engine
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.touched = []  # 命中后尚未写回使用时间的哈希
+        self.conn = None
+        if not enabled:
+            return
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS ocr_cache (
+                engine TEXT NOT NULL,
+                key BLOB NOT NULL,
+                text TEXT,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (engine, key)
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS ocr_cache_last_used ON ocr_cache (last_used)")
+        # 清除识别失败时误存的空结果
+        self.conn.execute("DELETE FROM ocr_cache WHERE text IS NULL OR text = ''")
+        self.conn.commit()
+        self.size = self.conn.execute("SELECT COUNT(*) FROM ocr_cache").fetchone()[0]
+
+    def key(self, mask: NDArray) -> Optional[bytes]:
+        return band_hash(mask) if self.enabled else None
+
+    def get(self, key: Optional[bytes]) -> Tuple[bool, Optional[str]]:
+        """返回 (是否命中, 识别结果)，命中的条目在下次写入时一并刷新使用时间"""
+        if key is None:
+            return False, None
+        row = self.conn.execute(
+            "SELECT text FROM ocr_cache WHERE engine = ? AND key = ?", (self.engine, key)
+        ).fetchone()
+        if row is None or not row[0]:
+            self.misses += 1
+            return False, None
+        self.touched.append(key)
+        if len(self.touched) >= TOUCH_BATCH:
+            self.put_many([])
+        self.hits += 1
+        return True, row[0]
+
+    def put_many(self, items) -> None:
+        """写入一批 (哈希, 识别结果)，没有识别出文字的结果不缓存"""
+        now = time.time()
+        items = [(self.engine, key, text, now) for key, text in items if key is not None and text]
+        if not items and not self.touched:
+            return
+        with self.conn:
+            if self.touched:
+                self.conn.executemany(
+                    "UPDATE ocr_cache SET last_used = ? WHERE engine = ? AND key = ?",
+                    [(now, self.engine, key) for key in self.touched]
+                )
+                self.touched = []
+            if not items:
+                return
+            # 先插入新的哈希并统计新增的条数，已有的哈希再更新结果，覆盖已有条目时不计入容量
+            before = self.conn.total_changes
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO ocr_cache (engine, key, text, last_used) VALUES (?, ?, ?, ?)",
+                items
+            )
+            self.size += self.conn.total_changes - before
+            self.conn.executemany(
+                "UPDATE ocr_cache SET text = ?, last_used = ? WHERE engine = ? AND key = ?",
+                [(text, last_used, engine, key) for engine, key, text, last_used in items]
+            )
+            if self.size > self.max_entries:
+                # 一次淘汰到容量的90%，避免每次写入都触发淘汰
+                self.size = self.conn.execute("SELECT COUNT(*) FROM ocr_cache").fetchone()[0]
+                excess = self.size - int(self.max_entries * 0.9)
+                if excess > 0:
+                    self.conn.execute(
+                        "DELETE FROM ocr_cache WHERE rowid IN "
+                        "(SELECT rowid FROM ocr_cache ORDER BY last_used LIMIT ?)",
+                        (excess,)
+                    )
+                    self.size -= excess
+
+    def put(self, key: Optional[bytes], text: Optional[str]) -> None:
+        self.put_many([(key, text)])
+
+    def report(self) -> None:
+        if self.touched:
+            self.put_many([])
+        total = self.hits + self.misses
+        if total:
+            print(f"OCR cache: {self.hits}/{total} hits ({self.hits / total:.1%}), {self.size} entries")
@@ -0,0 +1,162 @@
+import queue
+import traceback
+import multiprocessing
+from multiprocessing import shared_memory
+from typing import Any, Iterator, List, Optional, Tuple
+import numpy as np
+from numpy.typing import NDArray
+from params import OCR_ENGINE, OCR_WORKERS, OCR_WORKER_THREADS, OCR_POOL_SLOTS, OCR_POOL_SLOT_BYTES, OCR_BATCH_SIZE
+
+
+def load_extractor(engine: str = OCR_ENGINE, cpu_threads: Optional[int] = None, recognize: bool = True):
+    """按名称创建字幕识别器，recognize为False时不加载OCR模型，只用于记录和保存字幕"""
+    if not recognize:
+        from subtitle_extractor import SubtitleExtractorBase
+        return SubtitleExtractorBase()
+    if engine == "cascade":
+        from CutSubtitle_cascade import SubtitleExtractor
+        return SubtitleExtractor(cpu_threads=cpu_threads)
+    if engine == "ddddocr":
+        from CutSubtitle import SubtitleExtractor
+        return SubtitleExtractor()
+    from CutSubtitle_paddleocr import SubtitleExtractor
+    return SubtitleExtractor(cpu_threads=cpu_threads)
+
+
+def _worker_main(engine, cpu_threads, shm_name, slot_bytes, task_queue, result_queue):
+    """OCR工作进程：从共享内存中读取字幕区域，识别后返回带时间戳的结果"""
+    try:
+        extractor = load_extractor(engine, cpu_threads)
+    except Exception:
+        result_queue.put((None, traceback.format_exc()))
+        return
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        while True:
+            task = task_queue.get()
+            if task is None:
+                break
+            chunk_id, items = task
+            # 直接在共享内存上构造数组视图，不经过pickle复制
+            bands = [
+                np.ndarray(shape, dtype=np.uint8, buffer=shm.buf, offset=slot * slot_bytes) if array is None else array
+                for slot, shape, _, array in items
+            ]
+            results = extractor.process_bands_scored(bands)
+            del bands
+            result_queue.put((chunk_id, [(timestamp, result) for (_, _, timestamp, _), result in zip(items, results)]))
+        extractor.report()
+    finally:
+        shm.close()
+
+
+class OCRWorkerPool:
+    """多进程OCR
+
+    生产者把字幕区域写入共享内存环形缓冲区的空闲槽位，只通过队列发送槽位号和尺寸，
+    工作进程直接读取共享内存识别。连续的字幕区域按块提交，同一块由同一个工作进程识别，
+    块内保留字幕变化检测的效果；各块由空闲的工作进程取走，相邻的块可能在不同进程中识别，
+    此时块的第一个字幕区域不能复用上一块的结果，只能依靠共享的OCR缓存。结果按提交顺序返回。
+    """
+
+    def __init__(
+        self,
+        workers: int = OCR_WORKERS,
+        engine: str = OCR_ENGINE,
+        cpu_threads: Optional[int] = OCR_WORKER_THREADS,
+        slots: int = OCR_POOL_SLOTS,
+        slot_bytes: int = OCR_POOL_SLOT_BYTES,
+        chunk_size: int = OCR_BATCH_SIZE
+    ) -> None:
+        self.slot_bytes = slot_bytes
+        # 每个工作进程至少能同时分到一块
+        self.chunk_size = max(1, min(chunk_size, slots // workers))
+        self.shm = shared_memory.SharedMemory(create=True, size=slots * slot_bytes)
+        self.free_slots = list(range(slots))
+
+        ctx = multiprocessing.get_context("spawn")
+        self.task_queue = ctx.Queue()
+        self.result_queue = ctx.Queue()
+        self.processes = [
+            ctx.Process(
+                target=_worker_main,
+                args=(engine, cpu_threads, self.shm.name, slot_bytes, self.task_queue, self.result_queue),
+                daemon=True
+            )
+            for _ in range(workers)
+        ]
+        for process in self.processes:
+            process.start()
+
+        self.next_chunk = 0  # 下一个提交的块号
+        self.next_output = 0  # 下一个按顺序输出的块号
+        self.pending = {}  # 块号 -> (元数据列表, 占用的槽位)
+        self.results = {}  # 块号 -> 带时间戳的识别结果
+        print(f"Started {workers} OCR workers ({slots} shared memory slots)")
+
+    def _write(self, band: NDArray) -> Tuple[int, tuple, Optional[NDArray]]:
+        """写入一个空闲槽位，超过槽位大小的字幕区域改为随消息发送"""
+        band = np.ascontiguousarray(band, dtype=np.uint8)
+        if band.nbytes > self.slot_bytes:
+            return -1, band.shape, band
+        slot = self.free_slots.pop()
+        view = np.ndarray(band.shape, dtype=np.uint8, buffer=self.shm.buf, offset=slot * self.slot_bytes)
+        view[...] = band
+        del view
+        return slot, band.shape, None
+
+    def _collect(self, block: bool) -> bool:
+        """取回一个已完成的块并释放其槽位，没有结果时返回False"""
+        try:
+            chunk_id, result = self.result_queue.get(timeout=1.0) if block else self.result_queue.get_nowait()
+        except queue.Empty:
+            if block and not all(process.is_alive() for process in self.processes):
+                raise RuntimeError("OCR worker exited unexpectedly")
+            return False
+        if chunk_id is None:
+            raise RuntimeError(f"OCR worker failed to start:\n{result}")
+        metas, slots = self.pending[chunk_id]
+        self.free_slots.extend(slot for slot in slots if slot >= 0)
+        self.results[chunk_id] = result
+        return True
+
+    def submit(self, metas: List[Any], bands: List[NDArray], timestamps: List[str]) -> None:
+        """提交一批按时间顺序排列的字幕区域，槽位不足时等待已提交的块完成"""
+        for start in range(0, len(bands), self.chunk_size):
+            chunk = bands[start:start + self.chunk_size]
+            while len(self.free_slots) < len(chunk):
+                self._collect(block=True)
+            items = []
+            for band, timestamp in zip(chunk, timestamps[start:start + self.chunk_size]):
+                slot, shape, array = self._write(band)
+                items.append((slot, shape, timestamp, array))
+            self.pending[self.next_chunk] = (metas[start:start + self.chunk_size], [item[0] for item in items])
+            self.task_queue.put((self.next_chunk, items))
+            self.next_chunk += 1
+
+    def ready(self) -> Iterator[Tuple[Any, Tuple[Optional[str], Optional[float]]]]:
+        """按提交顺序产出已完成的 (元数据, (文本, 置信度))"""
+        while self._collect(block=False):
+            pass
+        while self.next_output in self.results:
+            metas, _ = self.pending.pop(self.next_output)
+            for meta, (timestamp, result) in zip(metas, self.results.pop(self.next_output)):
+                yield meta, result
+            self.next_output += 1
+
+    def drain(self) -> Iterator[Tuple[Any, Tuple[Optional[str], Optional[float]]]]:
+        """等待所有已提交的块完成并按顺序产出结果"""
+        while self.next_output < self.next_chunk:
+            if self.next_output not in self.results:
+                self._collect(block=True)
+            yield from self.ready()
+
+    def close(self) -> None:
+        for _ in self.processes:
+            self.task_queue.put(None)
+        for process in self.processes:
+            process.join(timeout=30)
+            if process.is_alive():
+                process.terminate()
+        self.shm.close()
+        self.shm.unlink()
@@ -3,6 +3,7 @@ VIDEOS_FOLDER = "Videos"  # VV视频的文件夹
 FEATURES_FILE = "face_features_insightface.npz"  # 人脸特征向量文件
 FRAMES_OUTPUT = "output_frames"  # 帧文件夹
 SUBTITLE_OUTPUT = "subtitle"  # 字幕输出文件夹
+SUBTITLE_CORPUS = "subtitle_corpus.bin"  # 由字幕JSON打包生成的列式字幕库，相对路径时放在字幕文件夹所在的目录，运行 python subtitle_corpus.py 生成
 FACE_IMAGES_FOLDER = "target"  # VV人脸图片文件夹
 
 # GPU配置
@@ -11,6 +12,80 @@ USE_GPU_OCR = False   # 是否在OCR中使用GPU
 USE_GPU_SEARCH = False  # 是否在句意搜索中使用GPU
 GPU_MEMORY_OCR = 500  # OCR的GPU内存限制(MB)
 SEARCH_BATCH_SIZE = 32  # 批处理大小
+OCR_BATCH_SIZE = 16  # OCR批量识别时每批的字幕区域数量
+FACE_BATCH_SIZE = 16  # 人脸识别时每批处理的帧数，批内所有人脸一次送入识别模型
 
 # OCR模型配置
 OCR_MODEL_DIR = "ch_PP-OCRv4_rec_infer"  # OCR模型目录
+OCR_ENGINE = "paddle"  # 字幕识别引擎: "paddle" / "ddddocr" / "cascade"(先用ddddocr，结果可疑时再用PaddleOCR)
+CASCADE_MIN_CONFIDENCE = 0.8  # cascade模式下ddddocr置信度低于该值时交给PaddleOCR复核
+CASCADE_NEIGHBOR_SIMILARITY = 0.6  # 与相邻字幕的识别结果相似度不低于该值但不相同时交给PaddleOCR复核
+
+# 流水线配置
+PIPELINE_MODE = "streaming"  # "streaming": 帧在内存中流转; "frames": 先保存帧到FRAMES_OUTPUT再识别
+PIPELINE_QUEUE_SIZE = 32  # 流水线各阶段之间队列的最大长度
+INGEST_WORKERS = 1  # 并行处理视频的工作进程数，大于1时每个进程各自加载一份模型(仅streaming模式)
+INGEST_WORKER_THREADS = 0  # 每个视频处理进程中人脸识别和OCR各自使用的CPU线程数，0表示 CPU核数 / INGEST_WORKERS
+
+# 视频解码配置
+VIDEO_DECODER = "opencv"  # 解码后端: "opencv" / "pyav" / "ffmpeg"
+DECODER_SPARSE = True  # 稀疏采样: 非采样帧只grab或由滤镜丢弃，不做完整的颜色转换
+DECODER_SEEK_GAP = 0  # 两个采样帧间隔不少于该帧数时改为seek跳转，0表示不seek(GOP较短的视频可设为关键帧间隔)
+
+# 字幕识别配置
+SKIP_UNCHANGED_SUBTITLE = True  # 字幕区域与上一帧相同时跳过OCR，复用上一次的结果
+SUBTITLE_CHANGE_THRESHOLD = 0.05  # 二值化文字像素的差异占比不超过该值时视为未变化
+SKIP_BLANK_SUBTITLE = True  # 字幕区域没有文字时不调用OCR
+SUBTITLE_MIN_TEXT_RATIO = 0.002  # 白色文字像素占比下限，低于该值视为空白
+SUBTITLE_MAX_TEXT_RATIO = 0.4  # 白色文字像素占比上限，高于该值视为白色背景而非字幕
+SUBTITLE_MIN_EDGES = 100  # 水平方向黑白跳变次数下限(按90像素高的字幕区域计，随区域高度等比换算)，用于区分文字笔画和大块白色区域
+
+# 人脸特征库配置
+USE_FAISS_GALLERY = False  # 特征库较大时使用FAISS内积索引匹配
+FAISS_GALLERY_MIN_SIZE = 10000  # 特征数量不少于该值时才启用FAISS
+
+# 人脸跟踪配置
+FACE_TRACKING = True  # 跟踪连续帧中的同一张人脸，只对新轨迹做识别
+FACE_TRACK_IOU = 0.3  # 检测框与轨迹的IoU不低于该值时视为同一张人脸
+FACE_TRACK_REVERIFY = 10  # 轨迹每经过多少个采样帧重新识别一次
+FACE_TRACK_MAX_MISSED = 1  # 轨迹连续多少帧未匹配后删除
+FACE_DETECT_INTERVAL = 1  # 每隔多少个采样帧做一次人脸检测，中间帧沿用已有轨迹(需开启跟踪)
+SAVE_FACE_EMBEDDINGS = True  # 保存每个视频逐帧的人脸特征，更换特征库后可直接重新计算相似度
+EMBEDDINGS_OUTPUT = "embeddings"  # 人脸特征输出文件夹
+FEATURE_WORKERS = 8  # 生成人脸特征库时并行解码和提取特征的线程数
+GALLERY_DEDUP_THRESHOLD = 0  # 加载时去除余弦相似度不低于该值的近似重复特征，0表示不去重
+
+# 镜头切换配置
+SHOT_DETECTION = True  # 比较相邻采样帧的缩略图检测镜头切换，索引保存在字幕文件夹中供重新处理时复用
+SHOT_CHANGE_THRESHOLD = 0.12  # 缩略图平均灰度差(0~1)超过该值时视为新镜头
+SHOT_DETECT_INTERVAL = 1  # 同一镜头内每隔多少个采样帧做一次人脸检测，镜头切换时立即重新检测(需开启跟踪)，1表示每帧检测
+
+# 字幕起止时间配置(仅streaming模式)
+ADAPTIVE_TIMING = False  # 在字幕变化的两个采样帧之间补充解码并二分查找，为每条字幕输出start/end(秒)
+TIMING_PRECISION = 0.1  # 二分查找的时间精度(秒)
+
+# 处理日志配置
+INGEST_JOURNAL = "ingest_journal.db"  # 记录每个视频处理阶段和进度的SQLite数据库，运行 python ingest_journal.py 查看进度
+
+# 字幕区域配置
+SUBTITLE_AREA = (235, 900, 1435, 990)  # 参考分辨率下的默认字幕区域 (左, 上, 右, 下)
+SUBTITLE_REFERENCE_SIZE = (1920, 1080)  # SUBTITLE_AREA对应的分辨率 (宽, 高)，其他分辨率按比例换算
+AUTO_SUBTITLE_ROI = True  # 处理每个视频前采样若干帧自动定位字幕区域，上下收紧到文字所在的行，左右不窄于默认区域
+SUBTITLE_CALIBRATION_FRAMES = 30  # 自动定位字幕区域时采样的帧数
+
+# OCR缓存配置
+OCR_CACHE = True  # 按字幕区域的感知哈希缓存OCR结果，重新处理视频或重复出现的字幕直接使用缓存
+OCR_CACHE_FILE = "ocr_cache.db"  # OCR缓存数据库文件
+OCR_CACHE_SIZE = 200000  # 缓存的最大条目数，超过后淘汰最久未使用的条目
+
+# 多进程OCR配置(仅streaming模式)
+OCR_WORKERS = 1  # OCR工作进程数，大于1时字幕区域经共享内存交给多个进程识别(INGEST_WORKERS大于1时不生效)
+OCR_WORKER_THREADS = 2  # 每个OCR工作进程的CPU线程数，一般取 CPU核数 / OCR_WORKERS
+OCR_POOL_SLOTS = 64  # 共享内存环形缓冲区的槽位数，即同时在途的字幕区域数量上限
+OCR_POOL_SLOT_BYTES = 1 << 20  # 每个槽位的字节数，超过该大小的字幕区域改为随消息发送
+
+# 字幕输出配置
+SUBTITLE_COMPACT_EVERY = 200  # 每追加多少条字幕将该视频的.jsonl日志整理一次为.json，0表示只在视频结束时整理
+SUBTITLE_DEDUP = False  # 整理字幕时合并OCR抖动产生的近似重复字幕，已有的JSON可运行 python subtitle_dedup.py 处理
+DEDUP_MAX_DISTANCE = 0.2  # 两条字幕只差漏字、多字或空白，且差异字数不超过较长一条的该比例时视为近似重复
+DEDUP_WINDOW = 5  # 只与最近这么多秒内的字幕比较
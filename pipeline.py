@@ -0,0 +1,216 @@
+import os
+import queue
+import threading
+import traceback
+from params import PIPELINE_QUEUE_SIZE, OCR_BATCH_SIZE, FACE_BATCH_SIZE, ADAPTIVE_TIMING, OCR_WORKERS
+from subtitle_timing import SubtitleTimer
+from ocr_pool import OCRWorkerPool
+
+# 队列结束标记
+_END = object()
+
+
+class StreamingPipeline:
+    """解码 → 人脸 → OCR 的流式处理流水线
+
+    各阶段运行在独立线程中，通过有界队列传递数据。帧只在内存中流转，
+    人脸阶段之后只保留字幕区域裁剪和相似度，不再写入/读取中间JPEG文件。
+    """
+
+    def __init__(
+        self,
+        face_recognizer,
+        subtitle_extractor,
+        queue_size=PIPELINE_QUEUE_SIZE,
+        batch_size=OCR_BATCH_SIZE,
+        face_batch_size=FACE_BATCH_SIZE,
+        adaptive_timing=ADAPTIVE_TIMING,
+        ocr_workers=OCR_WORKERS
+    ):
+        self.face_recognizer = face_recognizer
+        self.subtitle_extractor = subtitle_extractor
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.face_batch_size = face_batch_size
+        # 开启后在字幕变化处补充解码，为每条字幕输出精确的起止时间
+        self.timer = SubtitleTimer(subtitle_extractor.crop_subtitle) if adaptive_timing else None
+        # 大于1时OCR交给多个工作进程，在第一次处理视频时启动，之后的视频继续使用
+        self.ocr_workers = ocr_workers
+        self.ocr_pool = None
+
+    def _put(self, q, item, stop_event):
+        """向队列放入数据，下游出错退出时不会永久阻塞"""
+        while not stop_event.is_set():
+            try:
+                q.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q, stop_event):
+        """从队列取出数据，流水线停止时返回结束标记"""
+        while not stop_event.is_set():
+            try:
+                return q.get(timeout=0.5)
+            except queue.Empty:
+                continue
+        return _END
+
+    def _get_batch(self, q, stop_event, batch_size):
+        """阻塞取出一项后，再取出队列中已就绪的数据凑成一批，返回 (批数据, 是否已结束)"""
+        item = self._get(q, stop_event)
+        if item is _END:
+            return [], True
+        batch = [item]
+        while len(batch) < batch_size:
+            try:
+                item = q.get_nowait()
+            except queue.Empty:
+                break
+            if item is _END:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _decode_stage(self, video_path, fps, start_time, frame_queue, stop_event, errors):
+        try:
+            for item in self.face_recognizer.iter_sampled_frames(video_path, fps, start_time):
+                if not self._put(frame_queue, item, stop_event):
+                    break
+        except Exception as e:
+            errors.append(e)
+            stop_event.set()
+            traceback.print_exc()
+        finally:
+            self._put(frame_queue, _END, stop_event)
+
+    def _face_stage(self, frame_queue, band_queue, stop_event, errors):
+        try:
+            finished = False
+            while not finished:
+                batch, finished = self._get_batch(frame_queue, stop_event, self.face_batch_size)
+                if not batch:
+                    break
+                # 出错时逐帧重试，不丢弃整批帧的字幕区域
+                similarities = self.face_recognizer.get_face_similarities_safe(
+                    [frame for _, _, frame in batch],
+                    [int(frame_count / frame_rate) for frame_count, frame_rate, _ in batch]
+                )
+
+                for (frame_count, frame_rate, frame), similarity in zip(batch, similarities):
+                    timestamp = self.face_recognizer.format_timestamp(frame_count, frame_rate)
+                    # 与帧文件名中的 sim_0.812 保持相同精度
+                    similarity = round(similarity or 0.0, 3)
+                    print(f"Frame {frame_count}: {timestamp} - similarity = {similarity:.3f}")
+                    band = self.subtitle_extractor.crop_subtitle(frame)
+                    if band is None:
+                        continue
+                    if not self._put(band_queue, (frame_count, frame_rate, timestamp, similarity, band), stop_event):
+                        return
+        except Exception as e:
+            errors.append(e)
+            stop_event.set()
+            traceback.print_exc()
+        finally:
+            self._put(band_queue, _END, stop_event)
+
+    def _record_texts(self, video_title, results, on_progress):
+        """按时间顺序记录一批 (字幕区域信息, (文本, 置信度))"""
+        last = None
+        for (frame_count, frame_rate, timestamp, similarity, band), (text, confidence) in results:
+            last = (frame_count, frame_rate)
+            if self.timer is None:
+                self.subtitle_extractor.add_subtitle(video_title, timestamp, similarity, text, confidence=confidence)
+                continue
+            subtitle = self.timer.observe(frame_count, frame_rate, timestamp, similarity, band, text, confidence)
+            if subtitle is not None:
+                self._add_timed_subtitle(video_title, subtitle)
+        if on_progress is not None and last is not None:
+            on_progress(int(last[0] / last[1]))
+
+    def _add_timed_subtitle(self, video_title, subtitle):
+        self.subtitle_extractor.add_subtitle(
+            video_title, subtitle["timestamp"], subtitle["similarity"], subtitle["text"],
+            start=subtitle["start"], end=subtitle["end"], confidence=subtitle.get("confidence")
+        )
+
+    def process_video(self, video_path, output_folder, fps=1, start_time=None, on_progress=None):
+        """流式处理单个视频并保存其字幕文件，每识别完一批调用on_progress(最后一帧的秒数)"""
+        video_title = os.path.splitext(os.path.basename(video_path))[0]
+        frame_queue = queue.Queue(maxsize=self.queue_size)
+        band_queue = queue.Queue(maxsize=self.queue_size)
+        stop_event = threading.Event()
+        errors = []
+
+        workers = [
+            threading.Thread(
+                target=self._decode_stage,
+                args=(video_path, fps, start_time, frame_queue, stop_event, errors),
+                daemon=True
+            ),
+            threading.Thread(
+                target=self._face_stage,
+                args=(frame_queue, band_queue, stop_event, errors),
+                daemon=True
+            ),
+        ]
+        self.subtitle_extractor.writer.folder = output_folder
+        # 先定位该视频的字幕区域，之后的裁剪和补充解码都使用同一区域
+        self.subtitle_extractor.calibrate(video_path)
+        if self.timer is not None:
+            self.timer.start(video_path)
+        if self.ocr_workers > 1 and self.ocr_pool is None:
+            self.ocr_pool = OCRWorkerPool(self.ocr_workers)
+        for worker in workers:
+            worker.start()
+
+        # OCR阶段在当前线程中运行，队列中已就绪的字幕区域合并为一批识别
+        try:
+            finished = False
+            while not finished:
+                batch, finished = self._get_batch(band_queue, stop_event, self.batch_size)
+                if not batch:
+                    break
+
+                bands = [item[-1] for item in batch]
+                if self.ocr_pool is None:
+                    results = self.subtitle_extractor.process_bands_scored(bands)
+                    self._record_texts(video_title, zip(batch, results), on_progress)
+                else:
+                    # 提交后不等待，先记录已经按顺序完成的结果
+                    self.ocr_pool.submit(batch, bands, [item[2] for item in batch])
+                    self._record_texts(video_title, self.ocr_pool.ready(), on_progress)
+
+            if self.ocr_pool is not None:
+                self._record_texts(video_title, self.ocr_pool.drain(), on_progress)
+
+            if self.timer is not None:
+                for subtitle in self.timer.finish():
+                    self._add_timed_subtitle(video_title, subtitle)
+        except BaseException:
+            stop_event.set()
+            if self.ocr_pool is not None:
+                # 丢弃该视频尚未完成的识别任务，下一个视频重新启动工作进程
+                self.ocr_pool.close()
+                self.ocr_pool = None
+            raise
+        finally:
+            for worker in workers:
+                worker.join()
+            if self.timer is not None:
+                self.timer.close()
+
+        if errors:
+            raise errors[0]
+
+        self.subtitle_extractor.save_subtitles(output_folder, video_title)
+        self.face_recognizer.save_embeddings(video_title)
+        self.face_recognizer.save_shot_index(video_title)
+        self.subtitle_extractor.report()
+
+    def close(self):
+        """关闭OCR工作进程"""
+        if self.ocr_pool is not None:
+            self.ocr_pool.close()
+            self.ocr_pool = None
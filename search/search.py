@@ -5,7 +5,6 @@ import logging
 import numpy as np
 from dataclasses import dataclass
 from sentence_transformers import SentenceTransformer
-from tqdm import tqdm
 from rich.console import Console
 from rich.prompt import Prompt, FloatPrompt, IntPrompt
 from rich.panel import Panel
@@ -14,6 +13,7 @@ from rich.table import Table
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 from params import USE_GPU_SEARCH, SEARCH_BATCH_SIZE
+from subtitle_corpus import load_corpus
 from mapping import get_video_url  # 在文件开头添加导入
 
 # 配置日志和控制台
@@ -28,12 +28,33 @@ class SubtitleEntry:
     filename: str
     image_similarity: float = 0.0  # 添加图像相似度字段
 
+class CorpusEntries:
+    """字幕库上的只读列表，按下标访问时才构造SubtitleEntry"""
+    def __init__(self, corpus):
+        self.corpus = corpus
+
+    def __len__(self):
+        return len(self.corpus)
+
+    def __getitem__(self, i):
+        i = int(i)
+        return SubtitleEntry(
+            text=self.corpus.text(i),
+            timestamp=self.corpus.timestamp(i),
+            filename=self.corpus.title(i),
+            image_similarity=round(float(self.corpus.similarity[i]), 4)
+        )
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
 class SubtitleSearch:
     def __init__(self, subtitle_folder, model_name='BAAI/bge-large-zh-v1.5'):
         self.subtitle_folder = subtitle_folder
         self.use_gpu = USE_GPU_SEARCH
         self.model = SentenceTransformer(model_name, device='cuda' if self.use_gpu else 'cpu')
         self.entries = []
+        self.corpus = None
         self.min_image_similarity = 0.6
         self.search_k = 5
         self.index = None
@@ -41,23 +62,15 @@ class SubtitleSearch:
         self.min_text_similarity = 0.5  # 添加文本相似度阈值
         
     def load_subtitles(self):
-        json_files = [f for f in os.listdir(self.subtitle_folder) if f.endswith('.json')]
-        for filename in tqdm(json_files, desc="加载字幕文件"):
-            if filename.endswith('.json'):
-                filepath = os.path.join(self.subtitle_folder, filename)
-                with open(filepath, 'r', encoding='utf-8') as file:
-                    data = json.load(file)
-                    video_name = filename[:-5]  # 去除.json后缀
-                    for entry in data:
-                        self.entries.append(SubtitleEntry(
-                            text=entry['text'],
-                            timestamp=entry['timestamp'],
-                            filename=video_name,
-                            image_similarity=entry.get('similarity', 0.0)  # 读取图像相似度
-                        ))
+        # 从列式字幕库加载，字幕JSON有更新时自动重新生成字幕库
+        self.corpus = load_corpus(self.subtitle_folder)
+        self.entries = CorpusEntries(self.corpus)
 
     def create_index(self):
-        texts = [entry.text for entry in self.entries]
+        if isinstance(self.entries, CorpusEntries):
+            texts = self.corpus.texts()
+        else:
+            texts = [entry.text for entry in self.entries]
         self.sentence_embeddings = self.model.encode(
             texts,
             show_progress_bar=True,
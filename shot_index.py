@@ -0,0 +1,109 @@
+import os
+import bisect
+import cv2
+import numpy as np
+from typing import List, Optional
+from numpy.typing import NDArray
+from params import SHOT_DETECTION, SHOT_CHANGE_THRESHOLD, SUBTITLE_OUTPUT
+
+# 计算镜头差异时使用的缩略图尺寸 (宽, 高)
+SIGNATURE_SIZE = (32, 18)
+
+
+def frame_signature(frame: NDArray) -> NDArray:
+    """将帧缩小为灰度缩略图，用于廉价地比较相邻采样帧"""
+    gray = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
+    return cv2.resize(gray, SIGNATURE_SIZE, interpolation=cv2.INTER_AREA).astype(np.float32)
+
+
+def signature_difference(A: NDArray, B: NDArray) -> float:
+    """两张缩略图的平均绝对差，归一化到0~1"""
+    return float(np.mean(np.abs(A - B))) / 255.0
+
+
+def shot_index_path(video_title: str, output_folder: str = SUBTITLE_OUTPUT) -> str:
+    return os.path.join(output_folder, f"{video_title}.shots.npz")
+
+
+class ShotIndex:
+    """单个视频的镜头切换索引
+
+    boundaries 为每个新镜头开始的秒数（升序），第一个镜头从视频开头开始不记录。
+    """
+
+    def __init__(self, boundaries: Optional[List[int]] = None) -> None:
+        self.boundaries: List[int] = sorted(boundaries or [])
+
+    @classmethod
+    def load(cls, path: str) -> "ShotIndex":
+        data = np.load(path)
+        return cls([int(t) for t in data['boundaries']])
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        np.savez(path, boundaries=np.array(self.boundaries, dtype=np.int32))
+
+    def shot_of(self, second: int) -> int:
+        """返回该秒所在镜头的序号"""
+        return bisect.bisect_right(self.boundaries, second)
+
+    def __len__(self) -> int:
+        return len(self.boundaries) + 1
+
+
+class ShotDetector:
+    """逐个采样帧判断是否进入了新镜头
+
+    视频已有完整的镜头索引时直接查表，不再计算缩略图；否则比较相邻采样帧的缩略图差异，
+    并在整段视频处理完后保存索引，供重新处理时复用。
+    """
+
+    def __init__(self, threshold: float = SHOT_CHANGE_THRESHOLD, enabled: bool = SHOT_DETECTION) -> None:
+        self.threshold = threshold
+        self.enabled = enabled
+        self.reset()
+
+    def reset(self) -> None:
+        self.index: Optional[ShotIndex] = None
+        self.cached = False  # 索引是否来自已保存的文件
+        self.complete = False  # 是否从视频开头开始检测，只有完整的索引才会保存
+        self.boundaries: List[int] = []
+        self.previous_signature = None
+        self.previous_second = None
+
+    def start(self, video_title: str, from_beginning: bool = True, output_folder: str = SUBTITLE_OUTPUT) -> None:
+        """开始处理新视频，存在已保存的索引时加载它"""
+        self.reset()
+        if not self.enabled:
+            return
+        path = shot_index_path(video_title, output_folder)
+        if os.path.exists(path):
+            self.index = ShotIndex.load(path)
+            self.cached = True
+            print(f"Loaded shot index ({len(self.index)} shots) from {path}")
+        self.complete = from_beginning
+
+    def is_new_shot(self, second: int, frame: NDArray) -> bool:
+        """当前帧与上一个采样帧是否属于不同镜头，视频的第一帧视为新镜头"""
+        previous = self.previous_second
+        self.previous_second = second
+        if self.index is not None:
+            return previous is None or self.index.shot_of(second) != self.index.shot_of(previous)
+
+        signature = frame_signature(frame)
+        new_shot = (
+            self.previous_signature is None
+            or signature_difference(signature, self.previous_signature) > self.threshold
+        )
+        if new_shot and previous is not None:
+            self.boundaries.append(second)
+        self.previous_signature = signature
+        return new_shot
+
+    def save(self, video_title: str, output_folder: str = SUBTITLE_OUTPUT) -> None:
+        """保存本次检测得到的完整索引"""
+        if not self.enabled or self.cached or not self.complete or self.previous_second is None:
+            return
+        path = shot_index_path(video_title, output_folder)
+        ShotIndex(self.boundaries).save(path)
+        print(f"Shot index ({len(self.boundaries) + 1} shots) saved to {path}")
@@ -0,0 +1,100 @@
+import numpy as np
+from numpy.typing import NDArray
+from params import (
+    SKIP_UNCHANGED_SUBTITLE, SUBTITLE_CHANGE_THRESHOLD,
+    SKIP_BLANK_SUBTITLE, SUBTITLE_MIN_TEXT_RATIO, SUBTITLE_MAX_TEXT_RATIO, SUBTITLE_MIN_EDGES
+)
+
+# 字幕为白色文字，RGB三个通道都大于该值的像素视为文字
+WHITE_THRESHOLD = 245
+# SUBTITLE_MIN_EDGES 对应的字幕区域高度，其他高度的区域按比例换算
+REFERENCE_BAND_HEIGHT = 90
+
+
+def binarize_band(band: NDArray) -> NDArray:
+    """将字幕区域二值化为白色文字像素掩码"""
+    return np.all(band > WHITE_THRESHOLD, axis=2)
+
+
+def has_text(
+    mask: NDArray,
+    min_ratio: float = SUBTITLE_MIN_TEXT_RATIO,
+    max_ratio: float = SUBTITLE_MAX_TEXT_RATIO,
+    min_edges: int = SUBTITLE_MIN_EDGES
+) -> bool:
+    """根据白色像素密度和笔画边缘数量粗略判断字幕区域是否有文字"""
+    ratio = np.count_nonzero(mask) / mask.size
+    if ratio < min_ratio or ratio > max_ratio:
+        return False
+    # 文字笔画在水平方向上产生大量黑白跳变，大块的白色背景则很少
+    edges = np.count_nonzero(mask[:, 1:] != mask[:, :-1])
+    return edges >= min_edges * mask.shape[0] / REFERENCE_BAND_HEIGHT
+
+
+def band_difference(mask: NDArray, other: NDArray) -> float:
+    """两个二值化字幕区域中发生变化的文字像素占比，尺寸不同时返回1"""
+    if mask.shape != other.shape:
+        return 1.0
+    union = np.count_nonzero(mask | other)
+    if union == 0:
+        return 0.0
+    return np.count_nonzero(mask ^ other) / union
+
+
+def bands_match(mask: NDArray, other: NDArray, threshold: float = SUBTITLE_CHANGE_THRESHOLD) -> bool:
+    """文字像素差异占比不超过阈值时视为同一条字幕"""
+    return band_difference(mask, other) <= threshold
+
+
+class BandChangeDetector:
+    """OCR前的字幕区域检查：没有文字时跳过，与上一帧相同时复用上一次的OCR结果"""
+
+    def __init__(
+        self,
+        threshold: float = SUBTITLE_CHANGE_THRESHOLD,
+        enabled: bool = SKIP_UNCHANGED_SUBTITLE,
+        skip_blank: bool = SKIP_BLANK_SUBTITLE
+    ) -> None:
+        self.threshold = threshold
+        self.enabled = enabled
+        self.skip_blank = skip_blank
+        self.previous_mask = None
+        self.previous_text = None
+        self.ocr_calls = 0
+        self.ocr_skipped = 0
+        self.blank_skipped = 0
+
+    def is_unchanged(self, mask: NDArray) -> bool:
+        """文字像素差异占比不超过阈值时认为字幕未变化"""
+        if not self.enabled or self.previous_mask is None:
+            return False
+        return bands_match(mask, self.previous_mask, self.threshold)
+
+    def lookup(self, mask: NDArray):
+        """返回 (是否命中, 上一次的识别结果)，没有文字的区域直接命中空结果"""
+        if self.skip_blank and not has_text(mask):
+            self.blank_skipped += 1
+            return True, None
+        if self.is_unchanged(mask):
+            self.ocr_skipped += 1
+            return True, self.previous_text
+        return False, None
+
+    def update(self, mask: NDArray, text, cached: bool = False) -> None:
+        """记录一次OCR结果，cached表示结果来自OCR缓存而非实际调用"""
+        if not cached:
+            self.ocr_calls += 1
+        self.previous_mask = mask
+        self.previous_text = text
+
+    def reset(self) -> None:
+        self.previous_mask = None
+        self.previous_text = None
+
+    def report(self) -> None:
+        total = self.ocr_calls + self.ocr_skipped + self.blank_skipped
+        if total:
+            print(
+                f"OCR calls: {self.ocr_calls}, skipped unchanged: {self.ocr_skipped}, "
+                f"skipped blank: {self.blank_skipped} ({(total - self.ocr_calls) / total:.1%} saved)"
+            )
@@ -0,0 +1,279 @@
+import os
+import re
+import mmap
+import json
+import struct
+import argparse
+from typing import Dict, Iterator, List, Optional, Tuple
+import numpy as np
+from numpy.typing import NDArray
+from params import SUBTITLE_OUTPUT, SUBTITLE_CORPUS
+from subtitle_writer import parse_timestamp, create_temp_file
+
+# 文件格式：
+#   8字节魔数 b"VVCORPUS"、uint32版本号、uint32头部长度，然后是UTF-8 JSON头部，
+#   头部记录每一列的 [dtype, 字节偏移, 元素个数]，各列按8字节对齐依次存放，均为小端序。
+# 字幕按 (视频, 时间) 排序，每个视频的字幕是连续的一段。
+#   file:         (N,)   int32   字幕所属视频在视频表中的序号
+#   time_ms:      (N,)   int32   timestamp字段对应的毫秒数
+#   start_ms:     (N,)   int32   start字段的毫秒数，没有时为-1
+#   end_ms:       (N,)   int32   end字段的毫秒数，没有时为-1
+#   similarity:   (N,)   float32 人脸相似度
+#   text_offsets: (N+1,) int64   第i条字幕的文本为 text_data[text_offsets[i]:text_offsets[i+1]]
+#   text_data:    (T,)   uint8   UTF-8文本
+# 视频表：
+#   file_starts:  (F+1,) int64   第j个视频的字幕为 [file_starts[j], file_starts[j+1])
+#   file_episode: (F,)   int32   集数，从 "[P001]" 这样的前缀解析，没有时为0
+#   name_offsets: (F+1,) int64   视频名(不含.json)在name_data中的范围
+#   name_data:    (S,)   uint8   UTF-8视频名
+MAGIC = b"VVCORPUS"
+VERSION = 1
+_PREAMBLE = struct.Struct("<8sII")
+_ALIGN = 8
+
+
+def parse_episode(title: str) -> int:
+    """从视频名中解析集数，如 "[P001]1 弹指一挥间" 为1"""
+    match = re.match(r'\[P(\d+)\]', title)
+    return int(match.group(1)) if match else 0
+
+
+def format_timestamp(seconds: int) -> str:
+    """将秒数格式化为字幕JSON使用的时间戳，如 "2m28s" """
+    return f"{seconds // 60}m{seconds % 60:02d}s"
+
+
+def _offsets(chunks: List[bytes]) -> NDArray:
+    offsets = np.zeros(len(chunks) + 1, dtype=np.int64)
+    np.cumsum([len(chunk) for chunk in chunks], out=offsets[1:])
+    return offsets
+
+
+class CorpusBuilder:
+    """逐个视频添加字幕，写出列式字幕库文件"""
+
+    def __init__(self) -> None:
+        self.titles: List[str] = []
+        self.counts: List[int] = []
+        self.time_ms: List[int] = []
+        self.start_ms: List[int] = []
+        self.end_ms: List[int] = []
+        self.similarity: List[float] = []
+        self.texts: List[bytes] = []
+
+    def add(self, title: str, subtitles: List[dict]) -> None:
+        """添加一个视频的全部字幕"""
+        subtitles = sorted(subtitles, key=lambda x: parse_timestamp(x["timestamp"]))
+        self.titles.append(title)
+        self.counts.append(len(subtitles))
+        for subtitle in subtitles:
+            self.time_ms.append(parse_timestamp(subtitle["timestamp"]) * 1000)
+            self.start_ms.append(int(round(subtitle["start"] * 1000)) if "start" in subtitle else -1)
+            self.end_ms.append(int(round(subtitle["end"] * 1000)) if "end" in subtitle else -1)
+            self.similarity.append(float(subtitle.get("similarity", 0.0)))
+            self.texts.append(subtitle["text"].encode('utf-8'))
+
+    def columns(self) -> Dict[str, NDArray]:
+        names = [title.encode('utf-8') for title in self.titles]
+        file_starts = np.zeros(len(self.titles) + 1, dtype=np.int64)
+        np.cumsum(self.counts, out=file_starts[1:])
+        return {
+            "file": np.repeat(np.arange(len(self.titles), dtype=np.int32), self.counts),
+            "time_ms": np.array(self.time_ms, dtype=np.int32),
+            "start_ms": np.array(self.start_ms, dtype=np.int32),
+            "end_ms": np.array(self.end_ms, dtype=np.int32),
+            "similarity": np.array(self.similarity, dtype=np.float32),
+            "text_offsets": _offsets(self.texts),
+            "text_data": np.frombuffer(b"".join(self.texts), dtype=np.uint8),
+            "file_starts": file_starts,
+            "file_episode": np.array([parse_episode(title) for title in self.titles], dtype=np.int32),
+            "name_offsets": _offsets(names),
+            "name_data": np.frombuffer(b"".join(names), dtype=np.uint8),
+        }
+
+    def write(self, path: str) -> None:
+        """写出字幕库文件，先写临时文件再替换，读取方不会看到写了一半的文件"""
+        columns = {name: np.ascontiguousarray(array, dtype=array.dtype.newbyteorder("<"))
+                   for name, array in self.columns().items()}
+
+        # 头部长度会影响列的偏移，先按列的相对位置排布，再整体后移
+        layout = {}
+        position = 0
+        for name, array in columns.items():
+            layout[name] = [array.dtype.str, position, len(array)]
+            position += -(-array.nbytes // _ALIGN) * _ALIGN
+
+        def encode_header(base):
+            header = {
+                "count": len(self.time_ms),
+                "files": len(self.titles),
+                "columns": {name: [dtype, base + offset, length] for name, (dtype, offset, length) in layout.items()},
+            }
+            return json.dumps(header).encode('utf-8')
+
+        # 偏移量的位数可能让头部变长，重复计算直到稳定
+        base = 0
+        while True:
+            header = encode_header(base)
+            new_base = -(-(_PREAMBLE.size + len(header)) // _ALIGN) * _ALIGN
+            if new_base == base:
+                break
+            base = new_base
+
+        folder = os.path.dirname(path) or "."
+        os.makedirs(folder, exist_ok=True)
+        fd, tmp_path = create_temp_file(folder)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(_PREAMBLE.pack(MAGIC, VERSION, len(header)))
+                f.write(header)
+                for name, array in columns.items():
+                    f.seek(layout[name][1] + base)
+                    f.write(array.tobytes())
+                f.truncate(base + position)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+
+class SubtitleCorpus:
+    """列式字幕库的只读视图，各列是直接映射文件内容的NumPy数组，加载时不解析文本"""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, header_length = _PREAMBLE.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != VERSION:
+            self._mmap.close()
+            raise ValueError(f"{path} is not a version {VERSION} subtitle corpus")
+        header = json.loads(self._mmap[_PREAMBLE.size:_PREAMBLE.size + header_length])
+        self.count = header["count"]
+        for name, (dtype, offset, length) in header["columns"].items():
+            setattr(self, name, np.frombuffer(self._mmap, dtype=np.dtype(dtype), count=length, offset=offset))
+        self._titles: Optional[List[str]] = None
+
+    def __len__(self) -> int:
+        return self.count
+
+    @property
+    def titles(self) -> List[str]:
+        """视频名表，首次访问时解码"""
+        if self._titles is None:
+            data = self.name_data.tobytes()
+            offsets = self.name_offsets.tolist()
+            self._titles = [data[offsets[j]:offsets[j + 1]].decode('utf-8') for j in range(len(offsets) - 1)]
+        return self._titles
+
+    @property
+    def episode(self) -> NDArray:
+        """每条字幕的集数"""
+        return self.file_episode[self.file]
+
+    def text(self, i: int) -> str:
+        return self.text_data[self.text_offsets[i]:self.text_offsets[i + 1]].tobytes().decode('utf-8')
+
+    def texts(self, start: int = 0, stop: Optional[int] = None) -> List[str]:
+        """解码一段连续字幕的文本"""
+        stop = self.count if stop is None else stop
+        offsets = self.text_offsets[start:stop + 1]
+        data = self.text_data[offsets[0]:offsets[-1]].tobytes()
+        offsets = (offsets - offsets[0]).tolist()
+        return [data[offsets[k]:offsets[k + 1]].decode('utf-8') for k in range(len(offsets) - 1)]
+
+    def title(self, i: int) -> str:
+        return self.titles[self.file[i]]
+
+    def timestamp(self, i: int) -> str:
+        return format_timestamp(int(self.time_ms[i]) // 1000)
+
+    def file_rows(self, file_id: int) -> Tuple[int, int]:
+        """第file_id个视频的字幕范围 [start, stop)"""
+        return int(self.file_starts[file_id]), int(self.file_starts[file_id + 1])
+
+    def _entry(self, i: int, text: str) -> dict:
+        entry = {
+            "timestamp": self.timestamp(i),
+            # float32保存，保留4位小数以还原JSON中的原值
+            "similarity": round(float(self.similarity[i]), 4),
+            "text": text,
+        }
+        if self.start_ms[i] >= 0:
+            entry["start"] = int(self.start_ms[i]) / 1000
+        if self.end_ms[i] >= 0:
+            entry["end"] = int(self.end_ms[i]) / 1000
+        return entry
+
+    def entry(self, i: int) -> dict:
+        """第i条字幕，格式与字幕JSON中的条目相同"""
+        return self._entry(i, self.text(i))
+
+    def iter_files(self) -> Iterator[Tuple[str, List[dict]]]:
+        """按视频依次产出 (视频名, 字幕列表)"""
+        for file_id, title in enumerate(self.titles):
+            start, stop = self.file_rows(file_id)
+            texts = self.texts(start, stop) if stop > start else []
+            yield title, [self._entry(start + k, text) for k, text in enumerate(texts)]
+
+    def close(self) -> None:
+        for name in list(vars(self)):
+            if isinstance(getattr(self, name), np.ndarray):
+                delattr(self, name)
+        try:
+            self._mmap.close()
+        except BufferError:
+            # 仍有取自字幕库的数组视图时无法立即关闭，这些数组释放后映射随之释放
+            pass
+
+
+def corpus_path(subtitle_folder: str = SUBTITLE_OUTPUT) -> str:
+    """字幕库文件的默认路径，SUBTITLE_CORPUS为相对路径时放在字幕文件夹所在的目录，与当前工作目录无关"""
+    if os.path.isabs(SUBTITLE_CORPUS):
+        return SUBTITLE_CORPUS
+    return os.path.join(os.path.dirname(os.path.abspath(subtitle_folder)), SUBTITLE_CORPUS)
+
+
+def build_corpus(subtitle_folder: str = SUBTITLE_OUTPUT, path: Optional[str] = None) -> int:
+    """读取文件夹中全部字幕JSON写出字幕库，返回字幕条数"""
+    path = path or corpus_path(subtitle_folder)
+    builder = CorpusBuilder()
+    for filename in sorted(os.listdir(subtitle_folder)):
+        if not filename.endswith('.json'):
+            continue
+        with open(os.path.join(subtitle_folder, filename), 'r', encoding='utf-8') as f:
+            builder.add(os.path.splitext(filename)[0], json.load(f))
+    builder.write(path)
+    print(f"Built subtitle corpus {path}: {len(builder.time_ms)} subtitles from {len(builder.titles)} videos")
+    return len(builder.time_ms)
+
+
+def is_stale(subtitle_folder: str = SUBTITLE_OUTPUT, path: Optional[str] = None) -> bool:
+    """字幕库不存在，或字幕文件夹及其中的JSON比字幕库新时需要重新生成"""
+    path = path or corpus_path(subtitle_folder)
+    if not os.path.exists(path):
+        return True
+    built = os.path.getmtime(path)
+    if os.path.getmtime(subtitle_folder) > built:
+        return True
+    return any(
+        os.path.getmtime(os.path.join(subtitle_folder, filename)) > built
+        for filename in os.listdir(subtitle_folder) if filename.endswith('.json')
+    )
+
+
+def load_corpus(subtitle_folder: str = SUBTITLE_OUTPUT, path: Optional[str] = None) -> SubtitleCorpus:
+    """加载字幕库，字幕JSON有更新时先重新生成，不指定path时使用corpus_path(subtitle_folder)"""
+    path = path or corpus_path(subtitle_folder)
+    if is_stale(subtitle_folder, path):
+        build_corpus(subtitle_folder, path)
+    return SubtitleCorpus(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="将字幕JSON打包为列式字幕库文件")
+    parser.add_argument("--subtitles", default=SUBTITLE_OUTPUT, help="字幕JSON文件夹")
+    parser.add_argument("--output", help="字幕库文件，默认为字幕文件夹所在目录下的" + SUBTITLE_CORPUS)
+    args = parser.parse_args()
+    build_corpus(args.subtitles, args.output)
@@ -0,0 +1,163 @@
+import os
+import json
+import argparse
+from collections import Counter
+from typing import List, Optional, Tuple
+from params import SUBTITLE_OUTPUT, DEDUP_MAX_DISTANCE, DEDUP_WINDOW
+from subtitle_writer import parse_timestamp, atomic_write_json
+
+
+def _strip_spaces(text: str) -> str:
+    return "".join(text.split())
+
+
+def insertion_distance(a: str, b: str) -> Optional[int]:
+    """较短的字符串只通过插入字符就能得到较长的字符串时，返回插入的字符数，否则返回None
+
+    忽略空白字符。插入的字符中有数字时也返回None，数字的增减会改变字幕的意思。
+    """
+    a, b = _strip_spaces(a), _strip_spaces(b)
+    if len(a) < len(b):
+        a, b = b, a
+    inserted = []
+    j = 0
+    for ch in a:
+        if j < len(b) and ch == b[j]:
+            j += 1
+        else:
+            inserted.append(ch)
+    if j < len(b) or any(ch.isdigit() for ch in inserted):
+        return None
+    return len(inserted)
+
+
+def normalized_distance(a: str, b: str) -> Optional[float]:
+    """插入的字符数除以较长字符串的长度，0表示只有空白不同，不能只通过插入得到时为None"""
+    distance = insertion_distance(a, b)
+    if distance is None:
+        return None
+    longest = max(len(_strip_spaces(a)), len(_strip_spaces(b)))
+    return distance / longest if longest else 0.0
+
+
+def subtitle_time(subtitle: dict) -> float:
+    """字幕的开始时间(秒)，有start时使用start"""
+    if "start" in subtitle:
+        return float(subtitle["start"])
+    return float(parse_timestamp(subtitle["timestamp"]))
+
+
+class _Group:
+    """一组互为近似重复的字幕"""
+
+    def __init__(self, subtitle: dict) -> None:
+        self.members = [subtitle]
+        self.texts = {subtitle["text"]}
+        self.last_time = subtitle_time(subtitle)
+
+    def matches(self, text: str, max_distance: float) -> bool:
+        for other in self.texts:
+            # 长度差已经超过阈值时不必逐字比较
+            if abs(len(text) - len(other)) > max_distance * max(len(text), len(other)):
+                continue
+            distance = normalized_distance(text, other)
+            if distance is not None and distance <= max_distance:
+                return True
+        return False
+
+    def add(self, subtitle: dict) -> None:
+        self.members.append(subtitle)
+        self.texts.add(subtitle["text"])
+        self.last_time = max(self.last_time, subtitle_time(subtitle))
+
+    def merged(self) -> dict:
+        """合并为一条字幕：文本取最可信的写法，时间取最早的一条"""
+        if len(self.members) == 1:
+            return self.members[0]
+        counts = Counter(member["text"] for member in self.members)
+        confidence = {}
+        for member in self.members:
+            if "confidence" in member:
+                confidence[member["text"]] = max(confidence.get(member["text"], 0.0), float(member["confidence"]))
+        # 有OCR置信度时取置信度最高的写法，否则取出现次数最多的写法，再相同时取较长的（OCR抖动多为漏字）
+        text = max(counts, key=lambda t: (confidence.get(t, -1.0), counts[t], len(t)))
+
+        earliest = min(self.members, key=subtitle_time)
+        merged = dict(earliest)
+        merged["text"] = text
+        if text in confidence:
+            merged["confidence"] = confidence[text]
+        if any("end" in member for member in self.members):
+            merged["end"] = max(member["end"] for member in self.members if "end" in member)
+        return merged
+
+
+def collapse_subtitles(
+    subtitles: List[dict],
+    max_distance: float = DEDUP_MAX_DISTANCE,
+    window: float = DEDUP_WINDOW
+) -> List[dict]:
+    """合并时间上相近的近似重复字幕
+
+    字幕按时间顺序处理，与最近window秒内出现过的某组字幕只差漏字、多字或空白，
+    且差异的字数不超过较长一条的max_distance时并入该组，否则开始新的一组。
+    有字符被识别成了别的字（包括数字不同）的字幕不会合并。每组输出一条字幕，按时间排序。
+    """
+    ordered = sorted(subtitles, key=subtitle_time)
+    groups: List[_Group] = []
+    open_groups: List[_Group] = []
+    for subtitle in ordered:
+        text = subtitle.get("text") or ""
+        now = subtitle_time(subtitle)
+        open_groups = [group for group in open_groups if now - group.last_time <= window]
+        for group in reversed(open_groups):
+            if group.matches(text, max_distance):
+                group.add(subtitle)
+                break
+        else:
+            group = _Group(subtitle)
+            groups.append(group)
+            open_groups.append(group)
+    return [group.merged() for group in groups]
+
+
+def collapse_folder(subtitle_folder: str = SUBTITLE_OUTPUT, dry_run: bool = False) -> Tuple[int, int]:
+    """合并文件夹中每个字幕JSON的近似重复字幕，输出缩减量，返回 (合并前条数, 合并后条数)"""
+    total_before = total_after = 0
+    bytes_before = bytes_after = 0
+    for filename in sorted(os.listdir(subtitle_folder)):
+        if not filename.endswith('.json'):
+            continue
+        json_path = os.path.join(subtitle_folder, filename)
+        with open(json_path, 'r', encoding='utf-8') as f:
+            subtitles = json.load(f)
+
+        collapsed = collapse_subtitles(subtitles)
+        total_before += len(subtitles)
+        total_after += len(collapsed)
+        bytes_before += os.path.getsize(json_path)
+        if len(collapsed) == len(subtitles):
+            bytes_after += os.path.getsize(json_path)
+            continue
+
+        print(f"{os.path.splitext(filename)[0]}: {len(subtitles)} -> {len(collapsed)}")
+        if dry_run:
+            bytes_after += len(json.dumps(collapsed, ensure_ascii=False, indent=4).encode('utf-8'))
+        else:
+            atomic_write_json(json_path, collapsed)
+            bytes_after += os.path.getsize(json_path)
+
+    if total_before:
+        print(
+            f"Subtitles: {total_before} -> {total_after} ({1 - total_after / total_before:.1%} fewer), "
+            f"JSON size: {bytes_before / 1e6:.1f} MB -> {bytes_after / 1e6:.1f} MB"
+        )
+    return total_before, total_after
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="合并已有字幕JSON中的近似重复字幕")
+    parser.add_argument("--subtitles", default=SUBTITLE_OUTPUT, help="字幕JSON文件夹")
+    parser.add_argument("--dry-run", action="store_true", help="只统计可合并的数量，不修改文件")
+    args = parser.parse_args()
+    collapse_folder(args.subtitles, args.dry_run)
@@ -0,0 +1,96 @@
+import os
+import re
+from subtitle_band import BandChangeDetector
+from subtitle_roi import SubtitleROI
+from ocr_cache import OCRCache
+from subtitle_writer import SubtitleWriter
+
+
+class SubtitleExtractorBase:
+    """各OCR引擎字幕识别器的公共部分：字幕区域、变化检测、识别缓存和字幕输出
+
+    子类创建OCR模型后调用 super().__init__()，并实现 process_bands / process_bands_scored。
+    直接使用本类时不加载OCR模型，只定位、裁剪、记录和保存字幕，OCR交给工作进程时主进程使用。
+    """
+
+    # 识别结果缓存的分区名，不同引擎的识别结果分开缓存，为None时不打开缓存
+    cache_engine = None
+
+    def __init__(self):
+        # 字幕区域裁剪范围，按分辨率换算，可对每个视频自动定位
+        self.roi = SubtitleROI()
+        # 字幕逐条追加写入文件，内存中只保留每个视频的最后一条
+        self.writer = SubtitleWriter()
+        self.change_detector = BandChangeDetector()
+        self.cache = OCRCache(self.cache_engine) if self.cache_engine else None
+
+    def parse_timestamp(self, timestamp):
+        """将时间戳 (如 "2m28s") 转换为总秒数"""
+        match = re.match(r'(\d+)m(\d+)s', timestamp)
+        if match:
+            minutes, seconds = map(int, match.groups())
+            return minutes * 60 + seconds
+        return 0
+
+    def calibrate(self, video_path):
+        """处理新视频前定位其字幕区域"""
+        return self.roi.calibrate(video_path)
+
+    def crop_subtitle(self, frame):
+        """从内存中的RGB帧裁剪字幕区域，区域按帧的分辨率换算"""
+        return self.roi.crop(frame)
+
+    def add_subtitle(self, video_title, timestamp, similarity, text, start=None, end=None, confidence=None):
+        """记录一条字幕，与上一条相同时跳过，返回是否添加
+
+        传入start/end（秒）时一并保存起止时间，与上一条相同时延长上一条的结束时间。
+        有OCR置信度时一并保存，供合并近似重复字幕时选择写法。
+        """
+        if not text:
+            return False
+
+        print(f"识别到文本: {text}")
+
+        # 检查重复
+        last = self.writer.last(video_title)
+        if last and last["text"] == text:
+            if end is not None and "end" in last:
+                self.writer.update_last(video_title, end=end)
+            return False
+
+        # 添加字幕
+        subtitle = {
+            "timestamp": timestamp,
+            "similarity": float(similarity),
+            "text": text
+        }
+        if start is not None:
+            subtitle["start"] = start
+            subtitle["end"] = end
+        if confidence is not None:
+            subtitle["confidence"] = round(float(confidence), 4)
+        self.writer.append(video_title, subtitle)
+        return True
+
+    def save_subtitles(self, output_folder, video_title=None):
+        """保存字幕文件，指定video_title时只保存该视频，保存后释放该视频的状态"""
+        if not os.path.exists(output_folder):
+            os.makedirs(output_folder)
+
+        if video_title is None:
+            titles = self.writer.titles()
+        else:
+            titles = [video_title] if video_title in self.writer.titles() else []
+
+        for title in titles:
+            try:
+                self.writer.finish(title, output_folder)
+                print(f"成功保存 {title} 的字幕")
+            except Exception as e:
+                print(f"保存文件时出错: {str(e)}")
+
+    def report(self):
+        """输出OCR调用统计"""
+        self.change_detector.report()
+        if self.cache is not None:
+            self.cache.report()
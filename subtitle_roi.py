@@ -0,0 +1,138 @@
+from typing import Dict, Optional, Tuple
+import cv2
+import numpy as np
+from numpy.typing import NDArray
+from params import SUBTITLE_AREA, SUBTITLE_REFERENCE_SIZE, AUTO_SUBTITLE_ROI, SUBTITLE_CALIBRATION_FRAMES
+from subtitle_band import binarize_band, has_text
+
+Area = Tuple[int, int, int, int]
+
+# 在画面下方的这一部分中寻找字幕
+SEARCH_TOP = 0.7
+# 标定时某一行/列的文字像素累计量不低于峰值的该比例才计入字幕区域
+PROFILE_RATIO = 0.1
+# 至少在这么多个采样帧中检测到文字才采用标定结果
+MIN_TEXT_FRAMES = 3
+
+
+def scale_area(area: Area, width: int, height: int, reference_size: Tuple[int, int] = SUBTITLE_REFERENCE_SIZE) -> Area:
+    """将参考分辨率下的区域按比例换算到实际分辨率"""
+    sx = width / reference_size[0]
+    sy = height / reference_size[1]
+    left, top, right, bottom = area
+    return (int(round(left * sx)), int(round(top * sy)), int(round(right * sx)), int(round(bottom * sy)))
+
+
+def sample_frames(video_path: str, count: int = SUBTITLE_CALIBRATION_FRAMES):
+    """从视频中均匀抽取若干RGB帧，跳过片头片尾"""
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        return
+    try:
+        total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        if total <= 0:
+            return
+        for position in np.linspace(total * 0.05, total * 0.95, count, dtype=np.int64):
+            cap.set(cv2.CAP_PROP_POS_FRAMES, int(position))
+            ret, frame = cap.read()
+            if ret:
+                yield cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    finally:
+        cap.release()
+
+
+def _profile_span(profile: NDArray) -> Optional[Tuple[int, int]]:
+    """返回包含峰值的连续高值区间 [start, end)"""
+    if profile.max() <= 0:
+        return None
+    active = profile >= profile.max() * PROFILE_RATIO
+    peak = int(np.argmax(profile))
+    start = peak
+    while start > 0 and active[start - 1]:
+        start -= 1
+    end = peak + 1
+    while end < len(active) and active[end]:
+        end += 1
+    return start, end
+
+
+def locate_subtitle_area(frames) -> Tuple[Optional[Area], Tuple[int, int]]:
+    """根据若干帧中白色文字像素的分布定位字幕区域，返回 (区域, 帧尺寸(高, 宽))，文字太少时区域为None"""
+    heat = None
+    text_frames = 0
+    search_top = 0
+    width = height = 0
+    for frame in frames:
+        height, width = frame.shape[:2]
+        search_top = int(height * SEARCH_TOP)
+        mask = binarize_band(frame[search_top:])
+        if not has_text(mask):
+            continue
+        heat = mask.astype(np.float32) if heat is None else heat + mask
+        text_frames += 1
+
+    if heat is None or text_frames < MIN_TEXT_FRAMES:
+        return None, (height, width)
+    # 几乎每帧都是白色的像素属于台标等固定元素，而不是不断变化的字幕
+    heat[heat >= text_frames * 0.9] = 0
+
+    rows = _profile_span(heat.sum(axis=1))
+    if rows is None:
+        return None, (height, width)
+    top, bottom = rows
+    columns = np.flatnonzero(heat[top:bottom].sum(axis=0) > 0)
+    if len(columns) == 0:
+        return None, (height, width)
+
+    # 字幕水平居中，左右取对称范围，并留出余量以容纳比采样帧中更长的字幕
+    half = max(width / 2 - columns[0], columns[-1] + 1 - width / 2) + width * 0.05
+    margin = max(2, int((bottom - top) * 0.15))
+    area = (
+        max(0, int(width / 2 - half)),
+        max(0, search_top + top - margin),
+        min(width, int(width / 2 + half)),
+        min(height, search_top + bottom + margin),
+    )
+    return area, (height, width)
+
+
+class SubtitleROI:
+    """字幕裁剪区域
+
+    默认按参考分辨率下的固定区域等比换算到实际分辨率；对视频标定后上下收紧到
+    采样帧中文字所在的行，左右至少保留默认区域的宽度。两种字幕识别脚本共用。
+    """
+
+    def __init__(self, reference_area: Area = SUBTITLE_AREA, auto: bool = AUTO_SUBTITLE_ROI) -> None:
+        self.reference_area = reference_area
+        self.auto = auto
+        self.calibrated: Dict[Tuple[int, int], Area] = {}
+
+    def calibrate(self, video_path: str, count: int = SUBTITLE_CALIBRATION_FRAMES) -> Optional[Area]:
+        """从视频中采样定位字幕区域，失败时沿用默认区域"""
+        self.calibrated = {}
+        if not self.auto:
+            return None
+        area, (height, width) = locate_subtitle_area(sample_frames(video_path, count))
+        if area is None:
+            print("Subtitle area calibration failed, using the default area")
+            return None
+        default = self.area_for(height, width, calibrated=False)
+        # 采样帧中不一定有最长的字幕，水平方向不窄于默认区域，避免截掉未采样到的长字幕
+        area = (min(area[0], default[0]), area[1], max(area[2], default[2]), area[3])
+        self.calibrated[(height, width)] = area
+        print(f"Calibrated subtitle area {area} for {width}x{height} (default {default})")
+        return area
+
+    def area_for(self, height: int, width: int, calibrated: bool = True) -> Area:
+        if calibrated and (height, width) in self.calibrated:
+            return self.calibrated[(height, width)]
+        return scale_area(self.reference_area, width, height)
+
+    def crop(self, frame: NDArray) -> Optional[NDArray]:
+        """从RGB帧裁剪字幕区域，区域为空时返回None"""
+        left, top, right, bottom = self.area_for(*frame.shape[:2])
+        if right <= left or bottom <= top:
+            return None
+        # 复制一份，避免整帧因切片引用而无法释放
+        return frame[top:bottom, left:right].copy()
@@ -0,0 +1,122 @@
+from typing import Callable, List, Optional
+from numpy.typing import NDArray
+from params import TIMING_PRECISION
+from subtitle_band import binarize_band, band_difference
+from video_decoder import FrameReader
+
+
+class SubtitleTimer:
+    """为字幕计算精确到亚秒级的起止时间
+
+    按原采样间隔粗采样识别字幕，只在相邻两个采样帧的字幕文本不同时，
+    在两帧之间补充解码并二分查找字幕区域发生变化的那一帧。
+    每条字幕在文本第一次出现时开始，在下一次变化时结束。
+    """
+
+    def __init__(self, crop: Callable[[NDArray], Optional[NDArray]], precision: float = TIMING_PRECISION) -> None:
+        self.crop = crop
+        self.precision = precision
+        self.reader = None
+        self.reset()
+
+    def reset(self) -> None:
+        self.previous = None  # 上一个采样帧 (帧序号, 字幕区域, 文本)
+        self.current = None  # 正在持续的字幕
+        self.frame_rate = 0.0
+        self.interval = 1
+        self.transitions = 0
+        self.extra_frames = 0
+
+    def start(self, video_path: str) -> None:
+        """开始处理新视频"""
+        self.close()
+        self.reset()
+        self.reader = FrameReader(video_path)
+
+    def close(self) -> None:
+        if self.reader is not None:
+            self.extra_frames += self.reader.frames_read
+            self.reader.close()
+            self.reader = None
+
+    def _read_mask(self, frame_number: int) -> Optional[NDArray]:
+        frame = self.reader.read(frame_number)
+        if frame is None:
+            return None
+        band = self.crop(frame)
+        return None if band is None else binarize_band(band)
+
+    def find_transition(self, before: int, before_band: NDArray, after: int, after_band: NDArray) -> int:
+        """在 (before, after] 中二分查找字幕发生变化的第一帧"""
+        before_mask = binarize_band(before_band)
+        after_mask = binarize_band(after_band)
+        tolerance = max(1, int(self.precision * self.frame_rate))
+        while after - before > tolerance:
+            middle = (before + after) // 2
+            mask = self._read_mask(middle)
+            if mask is None:
+                break
+            # 与哪一侧更接近就归到哪一侧，避免背景噪声被误判为字幕变化
+            if band_difference(mask, before_mask) <= band_difference(mask, after_mask):
+                before = middle
+            else:
+                after = middle
+        return after
+
+    def _seconds(self, frame_number: int) -> float:
+        return round(frame_number / self.frame_rate, 2)
+
+    def observe(
+        self,
+        frame_count: int,
+        frame_rate: float,
+        timestamp: str,
+        similarity: float,
+        band: NDArray,
+        text: Optional[str],
+        confidence: Optional[float] = None
+    ) -> Optional[dict]:
+        """按时间顺序输入一个采样帧的识别结果，有字幕结束时返回该字幕"""
+        self.frame_rate = frame_rate
+        finished = None
+        previous = self.previous
+        if previous is not None:
+            self.interval = max(1, frame_count - previous[0])
+
+        if previous is None or previous[2] != text:
+            boundary = frame_count
+            if previous is not None:
+                self.transitions += 1
+                boundary = self.find_transition(previous[0], previous[1], frame_count, band)
+            if self.current is not None:
+                self.current["end"] = self._seconds(boundary)
+                finished = self.current
+                self.current = None
+            if text:
+                self.current = {
+                    "timestamp": timestamp,
+                    "similarity": similarity,
+                    "text": text,
+                    "start": self._seconds(boundary),
+                }
+                if confidence is not None:
+                    self.current["confidence"] = confidence
+
+        self.previous = (frame_count, band, text)
+        return finished
+
+    def finish(self) -> List[dict]:
+        """视频结束，返回最后一条尚未结束的字幕并输出统计"""
+        finished = []
+        if self.current is not None and self.previous is not None:
+            self.current["end"] = self._seconds(self.previous[0] + self.interval)
+            finished.append(self.current)
+            self.current = None
+        self.close()
+        if self.transitions:
+            print(
+                f"Refined {self.transitions} subtitle transitions with {self.extra_frames} extra frames "
+                f"({self.extra_frames / self.transitions:.1f} per transition, dense sampling would need "
+                f"{self.transitions * (self.interval - 1)})"
+            )
+        return finished
@@ -0,0 +1,210 @@
+import os
+import re
+import json
+import tempfile
+from typing import Dict, List, Optional, Tuple
+from params import SUBTITLE_OUTPUT, SUBTITLE_COMPACT_EVERY, SUBTITLE_DEDUP
+
+
+def parse_timestamp(timestamp: str) -> int:
+    """将时间戳 (如 "2m28s") 转换为总秒数"""
+    match = re.match(r'(\d+)m(\d+)s', timestamp)
+    if match:
+        minutes, seconds = map(int, match.groups())
+        return minutes * 60 + seconds
+    return 0
+
+
+def _file_mode() -> int:
+    """普通open()新建文件时的权限，即0o666去掉umask"""
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+# 启动时读取一次umask，避免每次写文件都临时修改进程的umask
+FILE_MODE = _file_mode()
+
+
+def create_temp_file(folder: str) -> Tuple[int, str]:
+    """在folder中创建用于原子替换的临时文件，返回 (文件描述符, 路径)
+
+    mkstemp创建的文件权限为0600，替换后其他用户（如网页服务）将无法读取，
+    因此改为与普通新建文件相同的权限。
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=folder, prefix=".", suffix=".tmp")
+    try:
+        os.chmod(tmp_path, FILE_MODE)
+    except BaseException:
+        os.close(fd)
+        os.unlink(tmp_path)
+        raise
+    return fd, tmp_path
+
+
+def atomic_write_json(path: str, data) -> None:
+    """先写入同目录下的临时文件再重命名，读取方不会看到写了一半的文件"""
+    folder = os.path.dirname(path) or "."
+    fd, tmp_path = create_temp_file(folder)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+class _VideoLog:
+    """单个视频的追加日志，内存中只保留最后一条字幕"""
+
+    def __init__(self, path: str, subtitles: Optional[List[dict]] = None) -> None:
+        self.path = path
+        self.count = 0
+        self.last: Optional[dict] = None
+        self.since_compact = 0
+        if not subtitles:
+            # 从头开始识别，覆盖上次中断时留下的日志
+            self.file = open(path, 'w', encoding='utf-8')
+            return
+
+        # 续跑时先把保留的字幕写入临时文件再替换日志，替换前中断也不会丢失原日志
+        fd, tmp_path = create_temp_file(os.path.dirname(path) or ".")
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                for index, subtitle in enumerate(subtitles):
+                    f.write(json.dumps([index, subtitle], ensure_ascii=False) + "\n")
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        self.file = open(path, 'a', encoding='utf-8')
+        self.count = len(subtitles)
+        self.last = subtitles[-1]
+
+    def write(self, index: int, subtitle: dict) -> None:
+        self.file.write(json.dumps([index, subtitle], ensure_ascii=False) + "\n")
+        self.file.flush()
+        self.since_compact += 1
+
+    def close(self) -> None:
+        self.file.close()
+
+
+def read_log(path: str) -> List[dict]:
+    """读取追加日志，同一序号以最后一次写入为准，忽略崩溃时写了一半的最后一行"""
+    entries: Dict[int, dict] = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                index, subtitle = json.loads(line)
+            except ValueError:
+                continue
+            entries[index] = subtitle
+    return [entries[index] for index in sorted(entries)]
+
+
+class SubtitleWriter:
+    """按视频流式写出字幕
+
+    每条字幕追加写入 <视频名>.jsonl，每追加SUBTITLE_COMPACT_EVERY条整理一次、
+    视频结束时最终整理为按时间排序的 <视频名>.json 并删除日志。
+    JSON文件总是整体替换，内存占用只与正在处理的视频有关。
+    """
+
+    def __init__(
+        self,
+        folder: str = SUBTITLE_OUTPUT,
+        compact_every: int = SUBTITLE_COMPACT_EVERY,
+        dedup: bool = SUBTITLE_DEDUP
+    ) -> None:
+        self.folder = folder
+        self.compact_every = compact_every
+        self.dedup = dedup
+        self.videos: Dict[str, _VideoLog] = {}
+
+    def log_path(self, video_title: str) -> str:
+        return os.path.join(self.folder, f"{video_title}.jsonl")
+
+    def _log(self, video_title: str) -> _VideoLog:
+        if video_title not in self.videos:
+            os.makedirs(self.folder, exist_ok=True)
+            self.videos[video_title] = _VideoLog(self.log_path(video_title))
+        return self.videos[video_title]
+
+    def resume(self, video_title: str, start_time: int) -> int:
+        """从start_time秒继续处理视频，载入上次中断时留下的日志中start_time之前的字幕
+
+        返回载入的条数，没有日志时返回-1，此时只能从头处理。
+        """
+        path = self.log_path(video_title)
+        if not os.path.exists(path):
+            return -1
+        subtitles = [
+            subtitle for subtitle in read_log(path)
+            if parse_timestamp(subtitle["timestamp"]) < start_time
+        ]
+        subtitles.sort(key=lambda x: parse_timestamp(x["timestamp"]))
+        self.discard(video_title)
+        self.videos[video_title] = _VideoLog(path, subtitles)
+        return len(subtitles)
+
+    def last(self, video_title: str) -> Optional[dict]:
+        """该视频最后一条字幕"""
+        log = self.videos.get(video_title)
+        return log.last if log else None
+
+    def append(self, video_title: str, subtitle: dict) -> None:
+        log = self._log(video_title)
+        log.last = subtitle
+        log.write(log.count, subtitle)
+        log.count += 1
+        self._maybe_compact(video_title)
+
+    def update_last(self, video_title: str, **fields) -> None:
+        """修改最后一条字幕（追加一条同序号的记录）"""
+        log = self.videos[video_title]
+        log.last.update(fields)
+        log.write(log.count - 1, log.last)
+        self._maybe_compact(video_title)
+
+    def _maybe_compact(self, video_title: str) -> None:
+        log = self.videos[video_title]
+        if self.compact_every and log.since_compact >= self.compact_every:
+            self.compact(video_title, self.folder)
+
+    def compact(self, video_title: str, output_folder: str) -> Tuple[int, int]:
+        """将日志整理为按时间排序的JSON文件，返回 (日志中的条数, 写出的条数)"""
+        log = self.videos[video_title]
+        subtitles = sorted(read_log(log.path), key=lambda x: parse_timestamp(x["timestamp"]))
+        count = len(subtitles)
+        if self.dedup:
+            # subtitle_dedup依赖本模块，在这里导入以避免循环导入
+            from subtitle_dedup import collapse_subtitles
+            subtitles = collapse_subtitles(subtitles)
+        os.makedirs(output_folder, exist_ok=True)
+        atomic_write_json(os.path.join(output_folder, f"{video_title}.json"), subtitles)
+        log.since_compact = 0
+        return count, len(subtitles)
+
+    def titles(self) -> List[str]:
+        return list(self.videos)
+
+    def finish(self, video_title: str, output_folder: str) -> None:
+        """视频处理完成：最终整理并删除日志，释放该视频的状态"""
+        count, written = self.compact(video_title, output_folder)
+        if written < count:
+            print(f"Collapsed {count - written} near-duplicate subtitles in {video_title} ({count} -> {written})")
+        log = self.videos.pop(video_title)
+        log.close()
+        os.unlink(log.path)
+
+    def discard(self, video_title: str) -> None:
+        """出错时放弃该视频的状态，日志保留到下次处理该视频时续跑或覆盖"""
+        log = self.videos.pop(video_title, None)
+        if log is not None:
+            log.close()
@@ -0,0 +1,73 @@
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "DataProcess"))
+from ngram_index import (
+    NgramIndex, build_ngram_index, decode_varints, encode_varints, full_scan, sample_queries,
+    varint_sizes, write_ngram_index
+)
+
+TEXTS = [
+    "这就是中国",
+    "中国是一个文明型国家",
+    "美国是77300美元",
+    "中国是66300美元",
+    "良政可以是西方的民主制度",
+    "良政也可以是非西方的制度",
+    "Hello World",
+    "",
+    "我们中国人",
+    "西方的民主模式",
+    "中国模式的特点",
+    "一带一路",
+]
+
+
+@pytest.mark.parametrize("values", [
+    [],
+    [0],
+    [0, 1, 127, 128, 255, 16383, 16384],
+    [2 ** 21 - 1, 2 ** 21, 2 ** 28, 2 ** 35 - 1],
+])
+def test_varint_round_trip(values):
+    encoded = encode_varints(values)
+    assert len(encoded) == int(varint_sizes(values).sum())
+    assert decode_varints(encoded).tolist() == values
+
+
+def test_varint_sizes():
+    assert varint_sizes([0, 127, 128, 16383, 16384]).tolist() == [1, 1, 2, 2, 3]
+
+
+def test_postings_round_trip(tmp_path):
+    path = str(tmp_path / "ngram.idx")
+    size = write_ngram_index(TEXTS, path)
+    assert os.path.getsize(path) == size
+
+    index = NgramIndex.load(path)
+    assert index.doc_count == len(TEXTS)
+    assert index.postings("中国").tolist() == [0, 1, 3, 8, 10]
+    assert index.postings("w").tolist() == [6]
+    assert index.postings("不存在").tolist() == []
+
+
+def test_rejects_other_files():
+    with pytest.raises(ValueError):
+        NgramIndex(b"NOTANIDX" + bytes(64))
+
+
+@pytest.mark.parametrize("query", [
+    "中国", "中国模式", "西方 民主", "美元 中国", "中国入", "hello", "一带一路", "政 制度", "国",
+])
+@pytest.mark.parametrize("min_ratio", [0, 50, 80, 100])
+def test_search_matches_full_scan(query, min_ratio):
+    index = NgramIndex(build_ngram_index(TEXTS))
+    assert index.search(TEXTS, query, min_ratio) == full_scan(TEXTS, query, min_ratio)
+
+
+def test_sampled_queries_match_full_scan():
+    index = NgramIndex(build_ngram_index(TEXTS))
+    for query in sample_queries(TEXTS, 30):
+        assert index.search(TEXTS, query) == full_scan(TEXTS, query)
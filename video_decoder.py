@@ -0,0 +1,270 @@
+import json
+import subprocess
+import time
+from fractions import Fraction
+from typing import Iterator, Optional, Tuple
+
+import cv2
+import numpy as np
+from numpy.typing import NDArray
+from params import VIDEO_DECODER, DECODER_SPARSE, DECODER_SEEK_GAP
+
+
+class VideoDecoder:
+    """视频解码器基类
+
+    iter_frames 按 frame_count % interval == 0 的规则产出 (帧序号, 帧率, RGB帧)，
+    与原先逐帧读取时的采样位置和时间戳完全一致。子类只需实现 _iter_sampled。
+    """
+
+    name = "base"
+
+    def __init__(self, video_path: str, sparse: bool = DECODER_SPARSE, seek_gap: int = DECODER_SEEK_GAP) -> None:
+        self.video_path = video_path
+        self.sparse = sparse
+        self.seek_gap = seek_gap
+        self.frame_rate = 0.0
+        self.frames_decoded = 0  # 完整解码并转换为RGB的帧数
+        self.frames_skipped = 0  # 只解复用/跳过、未转换的帧数
+        self.elapsed = 0.0
+
+    def open(self) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+    def _iter_sampled(self, interval: int, start_frame: int) -> Iterator[Tuple[int, NDArray]]:
+        raise NotImplementedError
+
+    def iter_frames(self, fps: int = 1, start_time: Optional[int] = None) -> Iterator[Tuple[int, float, NDArray]]:
+        """产出采样帧，结束时统计解码速度"""
+        self.open()
+        try:
+            interval = max(1, int(self.frame_rate / fps))
+            start_frame = int(start_time * self.frame_rate) if start_time is not None else 0
+            # 只统计解码本身的耗时，不包含下游处理采样帧的时间
+            start = time.time()
+            for frame_count, frame in self._iter_sampled(interval, start_frame):
+                self.elapsed += time.time() - start
+                yield frame_count, self.frame_rate, frame
+                start = time.time()
+            self.elapsed += time.time() - start
+        finally:
+            self.close()
+
+    @property
+    def decode_fps(self) -> float:
+        """每秒解码的采样帧数（不含下游处理时间）"""
+        return self.frames_decoded / self.elapsed if self.elapsed > 0 else 0.0
+
+    def report(self) -> None:
+        print(
+            f"[{self.name}] decoded {self.frames_decoded} frames, skipped {self.frames_skipped} frames "
+            f"in {self.elapsed:.1f}s ({self.decode_fps:.1f} decoded fps)"
+        )
+
+
+class OpenCVDecoder(VideoDecoder):
+    """OpenCV解码，稀疏模式下非采样帧只grab不retrieve，间隔较大时直接seek"""
+
+    name = "opencv"
+
+    def open(self) -> None:
+        self.cap = cv2.VideoCapture(self.video_path)
+        if not self.cap.isOpened():
+            raise RuntimeError("Error: Cannot open video file.")
+        self.frame_rate = self.cap.get(cv2.CAP_PROP_FPS)
+
+    def close(self) -> None:
+        self.cap.release()
+
+    def _iter_sampled(self, interval: int, start_frame: int) -> Iterator[Tuple[int, NDArray]]:
+        cap = self.cap
+        frame_count = start_frame
+        if start_frame:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, frame_count)
+
+        while True:
+            if frame_count % interval == 0 or not self.sparse:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                if frame_count % interval == 0:
+                    self.frames_decoded += 1
+                    yield frame_count, cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+                else:
+                    self.frames_skipped += 1
+                frame_count += 1
+                continue
+
+            gap = interval - frame_count % interval
+            if self.seek_gap and gap >= self.seek_gap:
+                # 关键帧感知的seek，由解码器从最近的关键帧解码到目标帧
+                frame_count += gap
+                self.frames_skipped += gap
+                cap.set(cv2.CAP_PROP_POS_FRAMES, frame_count)
+                continue
+
+            if not cap.grab():
+                break
+            self.frames_skipped += 1
+            frame_count += 1
+
+
+class PyAVDecoder(VideoDecoder):
+    """PyAV解码，非采样帧不做YUV→RGB转换，间隔较大时seek到下一个采样点"""
+
+    name = "pyav"
+
+    def open(self) -> None:
+        import av
+        self.container = av.open(self.video_path)
+        self.stream = self.container.streams.video[0]
+        self.stream.thread_type = "AUTO"
+        rate = self.stream.guessed_rate or self.stream.average_rate
+        self.frame_rate = float(rate)
+
+    def close(self) -> None:
+        self.container.close()
+
+    def _seek(self, frame_count: int) -> None:
+        target = int(Fraction(frame_count) / Fraction(self.frame_rate) / self.stream.time_base)
+        self.container.seek(target, stream=self.stream, backward=True)
+
+    def _iter_sampled(self, interval: int, start_frame: int) -> Iterator[Tuple[int, NDArray]]:
+        if start_frame:
+            self._seek(start_frame)
+
+        next_sample = start_frame + (-start_frame) % interval
+        while True:
+            reseek = False
+            for frame in self.container.decode(self.stream):
+                if frame.time is None:
+                    continue
+                frame_count = int(round(frame.time * self.frame_rate))
+                if frame_count < next_sample:
+                    self.frames_skipped += 1
+                    continue
+                if frame_count % interval == 0:
+                    self.frames_decoded += 1
+                    yield frame_count, frame.to_ndarray(format="rgb24")
+                else:
+                    self.frames_skipped += 1
+                next_sample = frame_count + interval - frame_count % interval
+
+                if self.sparse and self.seek_gap and interval >= self.seek_gap:
+                    self._seek(next_sample)
+                    reseek = True
+                    break
+            if not reseek:
+                break
+
+
+class FFmpegPipeDecoder(VideoDecoder):
+    """ffmpeg子进程解码，由select滤镜在转换为RGB之前丢弃非采样帧"""
+
+    name = "ffmpeg"
+
+    def open(self) -> None:
+        probe = subprocess.run(
+            [
+                "ffprobe", "-v", "error", "-select_streams", "v:0",
+                "-show_entries", "stream=width,height,r_frame_rate",
+                "-of", "json", self.video_path
+            ],
+            capture_output=True, text=True, check=True
+        )
+        stream = json.loads(probe.stdout)["streams"][0]
+        self.width = int(stream["width"])
+        self.height = int(stream["height"])
+        self.frame_rate = float(Fraction(stream["r_frame_rate"]))
+        self.process = None
+
+    def close(self) -> None:
+        if self.process is not None:
+            self.process.stdout.close()
+            self.process.kill()
+            self.process.wait()
+
+    def _iter_sampled(self, interval: int, start_frame: int) -> Iterator[Tuple[int, NDArray]]:
+        offset = (-start_frame) % interval
+        cmd = ["ffmpeg", "-v", "error"]
+        if start_frame:
+            cmd += ["-ss", f"{start_frame / self.frame_rate:.6f}"]
+        cmd += ["-i", self.video_path, "-an"]
+        if self.sparse:
+            cmd += ["-vf", f"select=not(mod(n+{start_frame}\\,{interval}))"]
+        cmd += ["-vsync", "0", "-f", "rawvideo", "-pix_fmt", "rgb24", "-"]
+
+        self.process = subprocess.Popen(cmd, stdout=subprocess.PIPE, bufsize=10 ** 8)
+        frame_size = self.width * self.height * 3
+        frame_count = start_frame + offset if self.sparse else start_frame
+        while True:
+            frame = np.empty((self.height, self.width, 3), dtype=np.uint8)
+            if self.process.stdout.readinto(memoryview(frame).cast("B")) < frame_size:
+                break
+            if self.sparse or frame_count % interval == 0:
+                self.frames_decoded += 1
+                yield frame_count, frame
+                frame_count += interval if self.sparse else 1
+            else:
+                self.frames_skipped += 1
+                frame_count += 1
+
+
+class FrameReader:
+    """按帧序号随机读取单帧，用于在两个采样帧之间补充解码
+
+    目标帧在当前位置之后且距离不超过max_forward时逐帧grab前进，否则seek跳转。
+    """
+
+    def __init__(self, video_path: str, max_forward: int = 64) -> None:
+        self.video_path = video_path
+        self.max_forward = max_forward
+        self.cap = None
+        self.position = 0  # 下一次read将返回的帧序号
+        self.frames_read = 0
+
+    def open(self) -> None:
+        self.cap = cv2.VideoCapture(self.video_path)
+        if not self.cap.isOpened():
+            raise RuntimeError("Error: Cannot open video file.")
+        self.position = 0
+
+    def close(self) -> None:
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+
+    def read(self, frame_number: int) -> Optional[NDArray]:
+        """返回指定帧的RGB图像，读取失败时返回None"""
+        if self.cap is None:
+            self.open()
+        gap = frame_number - self.position
+        if gap < 0 or gap > self.max_forward:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, frame_number)
+        else:
+            for _ in range(gap):
+                if not self.cap.grab():
+                    return None
+        self.position = frame_number + 1
+        ret, frame = self.cap.read()
+        if not ret:
+            return None
+        self.frames_read += 1
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+
+DECODERS = {
+    OpenCVDecoder.name: OpenCVDecoder,
+    PyAVDecoder.name: PyAVDecoder,
+    FFmpegPipeDecoder.name: FFmpegPipeDecoder,
+}
+
+
+def create_decoder(video_path: str, backend: str = VIDEO_DECODER, **kwargs) -> VideoDecoder:
+    """根据名称创建解码器"""
+    if backend not in DECODERS:
+        raise ValueError(f"Unknown video decoder: {backend}")
+    return DECODERS[backend](video_path, **kwargs)